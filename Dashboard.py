@@ -1,8 +1,13 @@
 import streamlit as st
 
+import precompute
+import warmup
+
 st.set_page_config(
     page_title="Baraka Hygienics Dashboard", page_icon="🧴", layout="centered"
 )
+warmup.start()
+precompute.start()
 
 
 st.image(
@@ -31,3 +36,6 @@ st.markdown(
     Follow us on [Facebook](https://www.facebook.com) and [Instagram](https://www.instagram.com/barakahygienics/)
 """
 )
+
+if st.query_params.get("debug"):
+    precompute.show_status()
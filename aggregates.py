@@ -0,0 +1,91 @@
+"""Materialized monthly aggregate cube shared by all dashboard pages.
+
+The cube holds the sum and count of every measure per month, product
+category and expenditure type. It is built once per dataset version with a
+single grouped scan. The KPIs, decompositions, correlograms and forecast
+series are computed from it; the page charts query the dataset directly
+(see ``query.py``).
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import query
+import shared
+from dataset import ensure_dataset
+from profiling import span
+from state import current_state
+from utils import cached
+
+DIMENSIONS = ["Years", "Product Category", "Expenditure"]
+MEASURES = ["Revenue", "Sales", "Total", "Profit", "Expenses"]
+
+
+def build_cube(frame):
+    """Aggregate ``frame`` to one row per month, category and expenditure."""
+    cube = frame.groupby(DIMENSIONS, observed=True, dropna=False)[MEASURES].agg(
+        ["sum", "count"]
+    )
+    cube.columns = [f"{measure}_{agg}" for measure, agg in cube.columns]
+    return cube.reset_index()
+
+
+def load_cube(years=None):
+    """Return the cube of ``years`` (all years when ``None``).
+
+    Only the dimension and measure columns of the dataset partitions of
+    ``years`` are read, and aggregated by the query engine, once per dataset
+    version and set of years. The cube persisted by ``incremental.py`` is
+    sliced instead while it is current, and workers of ``serve.py`` slice
+    the shared cube.
+    """
+    key = None if years is None else tuple(sorted(years))
+
+    def build():
+        if shared.serving():
+            return shared_cube(years)
+        cube = current_state("cube.parquet")
+        if cube is None:
+            return query.cube(DIMENSIONS, MEASURES, years)
+        if years is not None:
+            cube = cube[cube["Years"].dt.year.isin(years)].reset_index(drop=True)
+        return cube
+
+    with span("load", "cube"):
+        cube = cached("cube", build, ensure_dataset(), key)
+    return cube.copy(deep=False)
+
+
+def shared_cube(years=None):
+    """The rows of ``years`` of the cube published by ``serve.py``."""
+    table = shared.mapped("cube")
+    if years is not None:
+        table = table.filter(pc.is_in(pc.year(table["Years"]), pa.array(years)))
+    return table.to_pandas()
+
+
+def monthly_totals(cube):
+    """Monthly Cost, Sales and Profit, with the month in a ``Month`` column."""
+    return (
+        cube.groupby("Years")[["Total_sum", "Sales_sum", "Profit_sum"]]
+        .sum()
+        .reset_index()
+        .set_axis(["Month", "Cost", "Sales", "Profit"], axis=1)
+    )
+
+
+def monthly_by(cube, dimension, measure):
+    """Monthly sums of ``measure`` with one zero-filled column per ``dimension``.
+
+    The index is the full monthly range of the cube, named ``Month``.
+    """
+    months = pd.date_range(cube["Years"].min(), cube["Years"].max(), freq="MS")
+    wide = cube.pivot_table(
+        index="Years", columns=dimension, values=measure, aggfunc="sum", observed=True
+    )
+    wide = wide.reindex(months, fill_value=0.0).fillna(0.0)
+    wide.columns = wide.columns.astype(str)
+    wide.columns.name = None
+    wide.index.name = "Month"
+    return wide
@@ -0,0 +1,155 @@
+"""Rolling-origin backtesting of the forecast models.
+
+Every model is refitted at each forecast origin on the months before it and
+scored on the months after it. Folds run in parallel worker processes and
+record fit time and peak memory next to the errors; the memory is traced in
+a separate fit, so the timings are not slowed by the tracing.
+
+Run ``python backtest.py --help`` for the command line options.
+"""
+
+import argparse
+import importlib
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregates import load_cube, monthly_totals
+from forecast import ARIMA_ORDER, MODELS, fit_model
+from warmup import HEAVY_MODULES
+
+
+def _load_models():
+    """Import statsmodels once per worker, before any fold is timed."""
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def _peak_memory(train, model, order):
+    """Peak bytes allocated while fitting ``model`` once more, untimed.
+
+    Tracing slows each model's fit down by a different factor, so the
+    timed fit runs without it.
+    """
+    tracemalloc.start()
+    try:
+        fit_model(train, model, order)
+    except Exception:  # the timed fit already recorded the error
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def _run_fold(task):
+    """Fit one model at one origin and score it; runs in a worker process."""
+    model, origin, train, test, order = task
+    started = time.perf_counter()
+    try:
+        fit = fit_model(train, model, order)
+        predicted = np.asarray(fit.forecast(len(test)))
+        error = None
+    except Exception as exc:  # a failed fit is reported, not fatal
+        predicted = np.full(len(test), np.nan)
+        error = repr(exc)
+    seconds = time.perf_counter() - started
+    peak = _peak_memory(train, model, order)
+
+    actual = test.to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.where(actual != 0, np.abs(predicted - actual) / np.abs(actual), np.nan)
+    return pd.DataFrame(
+        {
+            "model": model,
+            "origin": origin,
+            "step": np.arange(1, len(test) + 1),
+            "actual": actual,
+            "forecast": predicted,
+            "abs_error": np.abs(predicted - actual),
+            "ape": ape,
+            "fit_seconds": seconds,
+            "peak_kib": peak / 1024,
+            "error": error,
+        }
+    )
+
+
+def folds(series, horizon, min_train):
+    """Yield ``(origin, train, test)`` for every rolling forecast origin."""
+    for end in range(min_train, len(series)):
+        yield series.index[end], series.iloc[:end], series.iloc[end : end + horizon]
+
+
+def backtest(
+    series, models=MODELS, horizon=3, min_train=10, workers=None, order=ARIMA_ORDER
+):
+    """Return one row per model, origin and forecast step."""
+    tasks = [
+        (model, origin, train, test, order)
+        for origin, train, test in folds(series, horizon, min_train)
+        for model in models
+    ]
+    if not tasks:
+        raise ValueError(
+            f"{len(series)} observations leave no fold after {min_train} training months"
+        )
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_models) as pool:
+        return pd.concat(pool.map(_run_fold, tasks), ignore_index=True)
+
+
+def summarize(results):
+    """MAE and MAPE per model and horizon step, with fit cost per model.
+
+    ``folds`` counts the origins whose fit succeeded; failed fits are left
+    out of the errors and counted in ``failed``.
+    """
+    accuracy = (
+        results.groupby(["model", "step"])
+        .agg(
+            MAE=("abs_error", "mean"),
+            MAPE=("ape", "mean"),
+            folds=("abs_error", "count"),
+        )
+        .reset_index()
+    )
+    accuracy["MAPE"] *= 100
+    fits = results.drop_duplicates(["model", "origin"])
+    cost = (
+        fits.groupby("model")
+        .agg(
+            fit_seconds=("fit_seconds", "mean"),
+            peak_kib=("peak_kib", "mean"),
+            failed=("error", "count"),
+        )
+        .reset_index()
+    )
+    return accuracy.merge(cost, on="model")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--variable", default="Sales", choices=["Sales", "Cost", "Profit"]
+    )
+    parser.add_argument("--horizon", type=int, default=3)
+    parser.add_argument("--min-train", type=int, default=10)
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=MODELS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", help="also write the per-fold results to this file")
+    args = parser.parse_args(argv)
+
+    series = monthly_totals(load_cube()).set_index("Month")[args.variable]
+    series.index.freq = "MS"
+    results = backtest(
+        series, args.models, args.horizon, args.min_train, workers=args.workers
+    )
+    if args.csv:
+        results.to_csv(args.csv, index=False)
+    print(summarize(results).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
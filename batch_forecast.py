@@ -0,0 +1,199 @@
+"""Batch forecasting of every series the dashboard can show.
+
+Fits SES, Holt and ARIMA to the monthly Sales, Cost and Profit totals, the
+revenue of every product category and the expenses of every expenditure
+type in a process pool, and writes the results to the forecast store read
+by ``forecast.forecast``; the prediction page and the exported product and
+profit tables read the category and expenditure forecasts back
+(``views.stored_forecasts``). Each forecast step also stores its psi
+weight, and the in-sample residuals go to a file next to the store, so the
+prediction intervals of ``simulation.py`` need no fit either. ARIMA
+forecasts of the totals are stored under the order the prediction page
+tunes for them.
+
+Run ``python batch_forecast.py [horizon]`` to rebuild the store.
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import query
+from aggregates import load_cube, monthly_by
+from forecast import (
+    ARIMA_ORDER,
+    MODELS,
+    STORE_PATH,
+    fingerprint,
+    fit_model,
+    order_key,
+    residuals_path,
+)
+from order_search import search_order
+from simulation import psi_weights, residuals
+from state import current_state
+from utils import atomic_path
+
+HORIZON = 12
+
+
+def monthly_history():
+    """Monthly Cost, Sales and Profit indexed by month, the forecast input.
+
+    The prediction page forecasts the same frame (``views.history``), so
+    the fingerprints of the stored totals match the ones it looks up. The
+    totals persisted by ``incremental.py`` are read instead while current.
+    """
+    totals = current_state("totals.parquet")
+    if totals is None:
+        totals = query.monthly_totals().set_index("Month")
+    totals.index.freq = "MS"
+    return totals
+
+
+def build_series(cube, totals=None):
+    """Return every forecastable series keyed by ``(scope, name, variable)``.
+
+    ``totals`` defaults to ``monthly_history()``.
+    """
+    series = {}
+
+    if totals is None:
+        totals = monthly_history()
+    for variable in ("Sales", "Cost", "Profit"):
+        series["Total", "All", variable] = totals[variable]
+
+    for scope, measure, variable in (
+        ("Product Category", "Revenue_sum", "Revenue"),
+        ("Expenditure", "Expenses_sum", "Expenses"),
+    ):
+        wide = monthly_by(cube, scope, measure)
+        wide.index.freq = "MS"
+        for name in wide.columns:
+            series[scope, name, variable] = wide[name].rename(variable)
+    return series
+
+
+def arima_order(key, series):
+    """The ARIMA order the dashboard forecasts the series ``key`` with.
+
+    The prediction page tunes the order of the monthly totals
+    (``order_search.best_order``), so their forecasts are stored under the
+    tuned order; the other series use ``ARIMA_ORDER``.
+    """
+    if key[0] != "Total":
+        return ARIMA_ORDER
+    return search_order(series)["order"]
+
+
+def _fit_series(task):
+    """Fit every model to one series; runs in a worker process."""
+    (scope, name, variable), series, horizon, order = task
+    digest = fingerprint(series)
+    rows, errors, failures = [], [], []
+    for model in MODELS:
+        try:
+            fit = fit_model(series, model, order)
+            values = fit.forecast(horizon)
+            psi = psi_weights(fit, model, horizon)
+            resid = residuals(fit, model)
+        except Exception as exc:  # a bad series must not stop the batch
+            failures.append((scope, name, variable, model, repr(exc)))
+            continue
+        key = {
+            "fingerprint": digest,
+            "model": model,
+            "order": order_key(model, order),
+        }
+        rows.extend(forecast_rows(scope, name, variable, series, key, values, psi))
+        errors.extend(residual_rows(key, resid))
+    return rows, errors, failures
+
+
+def forecast_rows(scope, name, variable, series, key, values, psi):
+    """Store rows of the forecast ``values`` and ``psi`` weights of a fit."""
+    months = pd.date_range(
+        series.index.max() + pd.DateOffset(months=1), periods=len(values), freq="MS"
+    )
+    return [
+        {
+            "scope": scope,
+            "name": name,
+            "variable": variable,
+            "model": key["model"],
+            "order": key["order"],
+            "fingerprint": key["fingerprint"],
+            "step": step,
+            "Month": month,
+            "Forecast": float(value),
+            "Psi": float(weight),
+        }
+        for step, (month, value, weight) in enumerate(zip(months, values, psi), 1)
+    ]
+
+
+def residual_rows(key, resid):
+    """Rows of the in-sample residuals of a fit, one per month."""
+    return [
+        {**key, "Month": month, "Residual": float(value)}
+        for month, value in resid.dropna().items()
+    ]
+
+
+def write_store(frame, path=STORE_PATH, errors=None):
+    """Atomically replace the forecast store with ``frame``.
+
+    ``errors`` are the residual rows behind the ``Psi`` column of ``frame``.
+    They are written first, so a reader of the new store finds them.
+    """
+    errors = pd.DataFrame(
+        errors, columns=["fingerprint", "model", "order", "Month", "Residual"]
+    )
+    with atomic_path(residuals_path(path)) as tmp:
+        errors.to_parquet(tmp, index=False)
+    with atomic_path(path) as tmp:
+        frame.to_parquet(tmp, index=False)
+
+
+def run_batch(horizon=HORIZON, workers=None, store=STORE_PATH):
+    """Forecast every series in parallel and write the forecast store.
+
+    Returns the forecast frame and the list of failed ``(scope, name,
+    variable, model, error)`` fits.
+    """
+    tasks = [
+        (key, series, horizon, arima_order(key, series))
+        for key, series in build_series(load_cube()).items()
+    ]
+    rows, errors, failures = [], [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(_fit_series, tasks, chunksize=4):
+            rows.extend(results[0])
+            errors.extend(results[1])
+            failures.extend(results[2])
+    frame = pd.DataFrame(rows)
+    write_store(frame, store, errors)
+    return frame, failures
+
+
+def load_forecasts(scope=None, name=None, store=STORE_PATH):
+    """Read precomputed forecasts, optionally for one scope and name."""
+    if not os.path.exists(store):
+        return None
+    filters = []
+    if scope is not None:
+        filters.append(("scope", "==", scope))
+    if name is not None:
+        filters.append(("name", "==", name))
+    return pd.read_parquet(store, filters=filters or None)
+
+
+if __name__ == "__main__":
+    horizon = int(sys.argv[1]) if len(sys.argv) > 1 else HORIZON
+    frame, failures = run_batch(horizon)
+    series = frame[["scope", "name", "variable"]].drop_duplicates()
+    print(f"{len(series)} series, {len(frame)} forecasts -> {STORE_PATH}")
+    for failure in failures:
+        print("failed:", *failure)
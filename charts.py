@@ -0,0 +1,291 @@
+"""Chart builders and a Vega-Lite spec cache with data passed by reference.
+
+Charts draw from named datasets instead of inline rows. Each dataset is
+serialized to Arrow once per dataset version and year filter, and each spec
+is built once per color theme, so a theme change does not re-serialize data
+and charts sharing a frame share one serialized dataset.
+"""
+
+import altair as alt
+import pyarrow as pa
+
+from dataset import ensure_dataset
+from profiling import span
+from utils import cached
+
+# Vega-Lite time unit of each ``downsample`` bucket frequency.
+TIME_UNITS = {
+    "D": "yearmonthdate",
+    "W": "yearweek",
+    "M": "yearmonth",
+    "Q": "yearquarter",
+    "Y": "year",
+}
+
+
+def arrow_bytes(frame):
+    """Serialize ``frame`` to the Arrow IPC stream format charts expect."""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.RecordBatchStreamWriter(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def dataset(page, name, year, build):
+    """Return ``(name, bytes)`` of the frame from ``build()``.
+
+    The frame is built and serialized once per dataset version for each
+    ``page``, ``name`` and ``year``. The name does not include the year, so
+    a spec cached without the year still references the current data.
+    """
+    name = f"{page}_{name}"
+    with span("render", f"serialize {name} {year}"):
+        data = cached(
+            "chart-data", lambda: arrow_bytes(build()), ensure_dataset(), name, year
+        )
+    return name, data
+
+
+def chart_spec(key, build, datasets):
+    """Return the Vega-Lite spec of ``build()`` referencing ``datasets``.
+
+    ``build`` must draw from ``alt.NamedData`` so the spec holds no rows; it
+    is called once per ``key``. ``datasets`` is a list of ``dataset`` results.
+    """
+    with span("render", f"spec {key[0]} {key[1]}"):
+        spec = cached("chart-spec", lambda: build().to_dict(), ensure_dataset(), *key)
+    return dict(spec, datasets=dict(datasets))
+
+
+def cost_sales_profit_bars(data, theme, unit="yearmonth"):
+    return (
+        alt.Chart(data)
+        .mark_bar()
+        .encode(
+            x=alt.X(f"{unit}(Month):T", title="Month"),
+            y=alt.Y("Value:Q", title="Amount($)"),
+            color=alt.Color(
+                "Category:N",
+                scale=alt.Scale(scheme=theme),
+                legend=alt.Legend(title="Category"),
+            ),
+            tooltip=[
+                alt.Tooltip("Month:T", title="Month"),
+                alt.Tooltip("Category:N", title="Category"),
+                alt.Tooltip("Value:Q", title="Amount"),
+            ],
+        )
+        .properties(
+            width=800,
+            height=400,
+        )
+        .configure_axis(labelFontSize=12, titleFontSize=14)
+        .configure_title(fontSize=18, anchor="middle")
+        .configure_legend(labelFontSize=12, titleFontSize=14)
+    )
+
+
+def cost_sales_profit_lines(data, theme):
+    return (
+        alt.Chart(data)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X(
+                "Month:T", title="Month", axis=alt.Axis(format="%Y-%m", labelAngle=-45)
+            ),
+            y=alt.Y("Value:Q", title="Amount ($)"),
+            color=alt.Color(
+                "Category:N",
+                scale=alt.Scale(scheme=theme),
+                legend=alt.Legend(title="Metric"),
+            ),
+            strokeDash=alt.StrokeDash("Category:N", legend=None),
+        )
+        .properties(
+            width=800,
+            height=300,
+        )
+        .configure_legend(titleFontSize=14, labelFontSize=12)
+    )
+
+
+def expenditure_donut(data, theme):
+    return (
+        alt.Chart(data)
+        .mark_arc(innerRadius=50)
+        .encode(
+            theta=alt.Theta(field="Expenses", type="quantitative"),
+            color=alt.Color(
+                field="Expenditure",
+                type="nominal",
+                legend=alt.Legend(title="Expenditure Type"),
+                scale=alt.Scale(scheme=theme),
+            ),
+            tooltip=["Expenditure:N", "Expenses:Q"],
+        )
+        .properties(
+            width=700,
+            height=250,
+        )
+        .configure_legend(titleFontSize=12, labelFontSize=10)
+    )
+
+
+def product_overview(data, theme, unit="yearmonth"):
+    brush = alt.selection_interval(encodings=["x"])
+    click = alt.selection_point(encodings=["color"])
+
+    area = (
+        alt.Chart(data)
+        .mark_area(interpolate="basis")
+        .encode(
+            alt.X(f"{unit}(Years):T", title="Months"),
+            alt.Y("Sales:Q", title="Amount($)"),
+            color=alt.condition(
+                brush,
+                "Product Category:N",
+                alt.value("lightgray"),
+                scale=alt.Scale(scheme=theme),
+            ),
+        )
+        .properties(width=550, height=300)
+        .add_params(brush)
+        .transform_filter(click)
+    )
+
+    # Bottom panel is a bar chart of count vs product category
+    category_bars = (
+        alt.Chart(data)
+        .mark_bar()
+        .encode(
+            x="Count:Q",
+            y=alt.Y("Product Category:N", sort="-x"),
+            color=alt.condition(
+                click,
+                "Product Category:N",
+                alt.value("lightgray"),
+                scale=alt.Scale(scheme=theme),
+            ),
+        )
+        .transform_filter(brush)
+        .properties(
+            width=700,
+        )
+        .add_params(click)
+    )
+
+    return alt.vconcat(area, category_bars)
+
+
+def sales_distribution(data, theme):
+    return (
+        alt.Chart(data)
+        .mark_bar()
+        .encode(
+            y=alt.Y(
+                "Product Category:N", sort="-x"
+            ),  # Sort bars based on Sales and display on y-axis
+            x="Sales:Q",
+            color=alt.Color(
+                field="Product Category",
+                type="nominal",
+                legend=None,
+                scale=alt.Scale(scheme=theme),
+            ),
+            tooltip=["Product Category:N", "Sales:Q"],
+        )
+        .properties(
+            width=800,
+            height=400,
+        )
+        .configure_axisX(labelAngle=0)  # No need to tilt labels in horizontal layout
+        .configure_title(fontSize=20)
+    )
+
+
+def forecast_lines(data, var, title, theme, bands=None):
+    """History and forecast lines, over the ``Lower``-``Upper`` ``bands``."""
+    color = alt.Color("Type:N", scale=alt.Scale(scheme=theme))
+    lines = (
+        alt.Chart(data)
+        .mark_line(point=True)
+        .encode(
+            x="Date:T",
+            y=f"{var}:Q",
+            tooltip=["Date:T", f"{var}:Q"],
+            color=color,
+        )
+    )
+    if bands is None:
+        return lines.properties(title=title)
+    area = (
+        alt.Chart(bands)
+        .mark_area(opacity=0.2)
+        .encode(
+            x="Date:T",
+            y=alt.Y("Lower:Q", title=var),
+            y2="Upper:Q",
+            color=color,
+            tooltip=["Date:T", "Type", "Lower:Q", "Upper:Q"],
+        )
+    )
+    return alt.layer(area, lines).properties(title=title)
+
+
+def decomposition_lines(data, theme):
+    selection = alt.selection_point(
+        name="interval", fields=["Component"], on="click", clear=False
+    )
+
+    return (
+        alt.Chart(data)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("Month:T", title="Month"),
+            y=alt.Y("Value:Q", title="Amount ($)"),
+            color=alt.Color("Component:N", scale=alt.Scale(scheme=theme)),
+            opacity=alt.condition(selection, alt.value(1), alt.value(0.2)),
+        )
+        .properties(width=800, height=300, title="Financial Decomposition Analysis")
+        .configure_legend(titleFontSize=14, labelFontSize=12)
+        .add_params(selection)
+    )
+
+
+def correlogram_chart(data, title, theme):
+    """ACF and PACF stems side by side, with their confidence bands."""
+    base = alt.Chart(data).encode(x=alt.X("Lag:Q", title="Lag"))
+    band = (
+        base.mark_area(opacity=0.25)
+        .transform_calculate(Lower="-datum.Band")
+        .encode(y="Lower:Q", y2="Band:Q")
+    )
+    stems = base.mark_rule().encode(
+        y=alt.Y("Value:Q", title="Correlation"), y2=alt.datum(0)
+    )
+    points = base.mark_circle(size=40).encode(
+        y="Value:Q",
+        color=alt.Color("Function:N", scale=alt.Scale(scheme=theme), legend=None),
+        tooltip=["Function", "Lag", alt.Tooltip("Value:Q", format=".3f")],
+    )
+    return (
+        alt.layer(band, stems, points)
+        .properties(width=350, height=250)
+        .facet(column=alt.Column("Function:N", title=None))
+        .properties(title=title)
+    )
+
+
+def correlation_heatmap(data):
+    return (
+        alt.Chart(data)
+        .mark_rect()
+        .encode(
+            x="x:N",
+            y="y:N",
+            color=alt.Color("Correlation:Q", legend=alt.Legend(title=None)),
+            tooltip=["x", "y", "Correlation"],
+        )
+        .properties(title="Correlation Matrix", width=400, height=300)
+    )
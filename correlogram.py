@@ -0,0 +1,145 @@
+"""Vectorized autocorrelations and correlations of many monthly series.
+
+Like ``decompose``, the functions here take a 2-D array with one series per
+row, so the ACF, PACF and correlation matrix of every ``monthly_series``
+column are computed in one call and cached per dataset version. The ACF
+matches ``statsmodels.tsa.stattools.acf`` and the PACF its ``"ywm"`` method,
+with the confidence bands ``plot_acf`` and ``plot_pacf`` draw around zero.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from aggregates import load_cube
+from dataset import ensure_dataset
+from decompose import monthly_series
+from profiling import span
+from utils import cached
+
+NLAGS = 12
+ALPHA = 0.05
+
+
+def acf(values, nlags=NLAGS):
+    """Autocorrelations of each row at lags ``0..nlags``.
+
+    All lags come from one FFT of the demeaned rows; constant rows are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[1]
+    centered = values - values.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered, n=2 * n, axis=1)
+    autocovariance = np.fft.irfft(spectrum * spectrum.conj(), axis=1)[:, : nlags + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return autocovariance / autocovariance[:, :1]
+
+
+def pacf(autocorrelations):
+    """Partial autocorrelations from the rows of ``acf`` (Durbin-Levinson).
+
+    The recursion runs over lags; every series is updated at once.
+    """
+    r = np.asarray(autocorrelations, dtype=float)
+    nlags = r.shape[1] - 1
+    partial = np.ones_like(r)
+    phi = np.zeros((r.shape[0], nlags + 1))
+    variance = np.ones(r.shape[0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k in range(1, nlags + 1):
+            previous = phi[:, 1:k]
+            reflection = (
+                r[:, k] - (previous * r[:, k - 1 : 0 : -1]).sum(axis=1)
+            ) / variance
+            phi[:, 1:k] = previous - reflection[:, None] * previous[:, ::-1]
+            phi[:, k] = reflection
+            variance = variance * (1 - reflection**2)
+            partial[:, k] = reflection
+    return partial
+
+
+def bands(autocorrelations, nobs, alpha=ALPHA):
+    """Half-widths of the ACF (Bartlett) and PACF confidence bands.
+
+    Both are ``(n_series, nlags + 1)`` arrays, 0 at lag 0.
+    """
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    r = np.asarray(autocorrelations, dtype=float)
+    variance = np.ones_like(r) / nobs
+    variance[:, 0] = 0
+    variance[:, 2:] *= 1 + 2 * np.cumsum(r[:, 1:-1] ** 2, axis=1)
+    partial = np.full(r.shape, z / np.sqrt(nobs))
+    partial[:, 0] = 0
+    return z * np.sqrt(variance), partial
+
+
+def correlogram_frame(wide, nlags=NLAGS):
+    """ACF and PACF of every column of ``wide`` as a long frame.
+
+    Columns are the two levels of ``wide``'s columns (``Scope``, ``Series``),
+    ``Function`` (``ACF`` or ``PACF``), ``Lag``, ``Value`` and ``Band``, the
+    half-width of the confidence band. The PACF stops at half the sample
+    size, which is as far as it can be estimated.
+    """
+    values = wide.to_numpy().T
+    nobs = values.shape[1]
+    nlags = min(nlags, nobs - 1)
+    autocorrelations = acf(values, nlags)
+    partial_lags = min(nlags, nobs // 2 - 1)
+    partial = pacf(autocorrelations[:, : partial_lags + 1])
+    acf_band, pacf_band = bands(autocorrelations, nobs)
+    parts = []
+    for function, value, band in [
+        ("ACF", autocorrelations, acf_band),
+        ("PACF", partial, pacf_band[:, : partial_lags + 1]),
+    ]:
+        lags = value.shape[1]
+        part = pd.DataFrame(
+            {
+                "Function": function,
+                "Lag": np.tile(np.arange(lags), len(wide.columns)),
+                "Value": value.ravel(),
+                "Band": band.ravel(),
+            }
+        )
+        index = wide.columns.repeat(lags)
+        part.insert(0, "Scope", index.get_level_values(0))
+        part.insert(1, "Series", index.get_level_values(1))
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def correlation_matrix(wide):
+    """Pearson correlations between every pair of columns of ``wide``."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matrix = np.corrcoef(wide.to_numpy().T)
+    return pd.DataFrame(matrix, index=wide.columns, columns=wide.columns)
+
+
+def load_correlogram():
+    """Correlograms per ``(scope, series)`` and melted correlations per scope.
+
+    Built once per dataset version, so a rerun only looks frames up.
+    """
+
+    def build():
+        wide = monthly_series(load_cube())
+        functions = correlogram_frame(wide)
+        matrix = correlation_matrix(wide)
+        correlations = {}
+        for scope in wide.columns.unique(0):
+            block = matrix.loc[scope, scope]
+            melted = block.rename_axis("x").reset_index().melt("x", var_name="y")
+            correlations[scope] = melted.rename(columns={"value": "Correlation"})
+        return {
+            "correlograms": {
+                key: group.drop(columns=["Scope", "Series"]).reset_index(drop=True)
+                for key, group in functions.groupby(["Scope", "Series"], sort=False)
+            },
+            "correlations": correlations,
+            "matrix": matrix,
+        }
+
+    with span("transform", "correlogram"):
+        return cached("correlogram", build, ensure_dataset())
@@ -0,0 +1,140 @@
+"""Multi-workbook dataset partitioned by year and month.
+
+The "Expenditure per year" sheets of every ``data/*.xlsx`` workbook are
+written to ``year=YYYY/month=M/`` Parquet partitions. When two workbooks
+cover the same month, the later workbook (by file name) wins. Reading a set
+of years only opens the partitions of those years.
+
+Every build writes a new version directory under ``data/dataset/`` and then
+replaces ``_manifest.json``, which names it, the way ``shared.py`` versions
+its files. A scan that read an older manifest keeps its directory: a
+version is removed by a later build once it has been superseded for
+``GRACE_SECONDS``.
+"""
+
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+
+import pyarrow.compute as pc
+
+import shared
+from snapshot import SOURCE_GLOB, read_snapshot
+from utils import atomic_path
+
+DATASET_DIR = "data/dataset"
+MANIFEST = os.path.join(DATASET_DIR, "_manifest.json")
+GRACE_SECONDS = 300
+
+_build_lock = threading.Lock()
+
+
+def sources():
+    """Return the workbooks making up the dataset, oldest first."""
+    return sorted(glob.glob(SOURCE_GLOB))
+
+
+def source_versions():
+    """Modification times of the workbooks, keyed by absolute path."""
+    return {os.path.abspath(p): os.stat(p).st_mtime_ns for p in sources()}
+
+
+def _manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def dataset_dir():
+    """The directory of the current dataset version, rebuilt first if stale."""
+    ensure_dataset()
+    return os.path.join(DATASET_DIR, _manifest()["directory"])
+
+
+def build_dataset():
+    """Write every partition from the workbook snapshots as a new version."""
+    versions = source_versions()
+    owners = {}
+    for source in sources():
+        frame = read_snapshot(source)
+        months = frame["Years"].dt.to_period("M")
+        for month, part in frame.groupby(months):
+            owners[month] = (source, part)
+
+    name = f"v{time.time_ns()}"
+    with atomic_path(os.path.join(DATASET_DIR, name)) as tmp:
+        for month, (source, part) in owners.items():
+            directory = os.path.join(tmp, f"year={month.year}", f"month={month.month}")
+            os.makedirs(directory)
+            stem = os.path.splitext(os.path.basename(source))[0]
+            part.to_parquet(os.path.join(directory, f"{stem}.parquet"), index=False)
+    with atomic_path(MANIFEST) as tmp:
+        with open(tmp, "w") as f:
+            json.dump({"sources": versions, "directory": name}, f, indent=1)
+    _prune(name)
+
+
+def _prune(current):
+    """Remove the versions superseded more than ``GRACE_SECONDS`` ago."""
+    names = sorted(
+        (n for n in os.listdir(DATASET_DIR) if n.startswith("v") and "." not in n),
+        key=lambda n: int(n[1:]),
+    )
+    cutoff = time.time_ns() - GRACE_SECONDS * 10**9
+    # A version was superseded when the next one was written.
+    for name, successor in zip(names, names[1:]):
+        if name != current and int(successor[1:]) < cutoff:
+            shutil.rmtree(os.path.join(DATASET_DIR, name), ignore_errors=True)
+
+
+def ensure_dataset():
+    """Rebuild the dataset if a workbook was added, removed or changed.
+
+    Returns the manifest path, whose modification time versions the dataset.
+    Workers of ``serve.py`` never rebuild it; they return the manifest of the
+    shared tables published by the ingest process.
+    """
+    if shared.serving():
+        return shared.MANIFEST
+    with _build_lock:
+        if (_manifest() or {}).get("sources") != source_versions():
+            build_dataset()
+    return MANIFEST
+
+
+def years():
+    """Return the years with data, read from the partition names only.
+
+    Workers of ``serve.py`` read them from the shared cube instead.
+    """
+    if shared.serving():
+        months = shared.mapped("cube")["Years"]
+        return sorted(pc.unique(pc.year(months)).to_pylist())
+    return sorted(
+        int(name.split("=", 1)[1])
+        for name in os.listdir(dataset_dir())
+        if name.startswith("year=")
+    )
+
+
+def partitions():
+    """Return the file of every month partition, keyed by ``"YYYY-MM"``.
+
+    Each partition holds one file, named after the workbook it came from.
+    """
+    directory = dataset_dir()
+    files = {}
+    for year in os.listdir(directory):
+        if not year.startswith("year="):
+            continue
+        for month in os.listdir(os.path.join(directory, year)):
+            partition = os.path.join(directory, year, month)
+            for name in os.listdir(partition):
+                key = f"{year.split('=', 1)[1]}-{int(month.split('=', 1)[1]):02d}"
+                files[key] = os.path.join(partition, name)
+    return files
@@ -0,0 +1,155 @@
+"""Vectorized seasonal decomposition of many monthly series at once.
+
+``decompose`` works on a 2-D array with one series per row, so every
+variable, product category and expenditure type is decomposed in one call.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from aggregates import load_cube, monthly_by, monthly_totals
+from dataset import ensure_dataset
+from state import current_state
+from utils import cached
+
+
+def centered_moving_average(values):
+    """Centered 2x2 moving average of each row, NaN at both ends."""
+    ma = np.full(values.shape, np.nan)
+    ma[:, 1:] = (values[:, :-1] + values[:, 1:]) / 2
+    cma = np.full(values.shape, np.nan)
+    cma[:, 1:-1] = (ma[:, 1:-1] + ma[:, 2:]) / 2
+    return cma
+
+
+def seasonal_index(ratios, months):
+    """Median ratio-to-moving-average per calendar month, normalized to 100.
+
+    Returns an ``(n_series, 12)`` array; months without a ratio are NaN.
+    """
+    months = np.asarray(months) - 1
+    # Position of each observation among those of the same calendar month.
+    order = np.argsort(months, kind="stable")
+    ranked = months[order]
+    occurrence = np.empty(len(months), dtype=int)
+    occurrence[order] = np.arange(len(months)) - np.searchsorted(ranked, ranked)
+    counts = np.bincount(months, minlength=12)
+    padded = np.full((ratios.shape[0], 12, counts.max()), np.nan)
+    padded[:, months, occurrence] = ratios
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN months
+        median = np.nanmedian(padded, axis=2)
+        return 100 * median / np.nanmean(median, axis=1, keepdims=True)
+
+
+def linear_trend(values):
+    """Least-squares straight line through the finite values of each row."""
+    t = np.arange(values.shape[1], dtype=float)
+    valid = np.isfinite(values)
+    y = np.where(valid, values, 0.0)
+    n = valid.sum(axis=1)
+    st = (t * valid).sum(axis=1)
+    sy = y.sum(axis=1)
+    stt = (t * t * valid).sum(axis=1)
+    sty = (t * y).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sty - st * sy) / (n * stt - st * st)
+        intercept = (sy - slope * st) / n
+    return intercept[:, None] + slope[:, None] * t
+
+
+def decompose(values, months, index=None):
+    """Decompose each row of ``values`` observed in calendar ``months``.
+
+    Returns a dict of arrays: ``cma``, ``ratio``, ``seasonal_index``
+    (one column per calendar month), ``deseasonalized``, ``trend`` and
+    ``cyclic``, all percentages where the page shows them as such. A
+    precomputed seasonal ``index`` of the same shape is used when given.
+    """
+    values = np.asarray(values, dtype=float)
+    months = np.asarray(months)
+    cma = centered_moving_average(values)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = values / cma * 100
+        if index is None:
+            index = seasonal_index(ratio, months)
+        deseasonalized = values * 100 / index[:, months - 1]
+        trend = linear_trend(deseasonalized)
+        cyclic = deseasonalized / trend * 100
+    return {
+        "cma": cma,
+        "ratio": ratio,
+        "seasonal_index": index,
+        "deseasonalized": deseasonalized,
+        "trend": trend,
+        "cyclic": cyclic,
+    }
+
+
+def decompose_frame(wide, index=None):
+    """Decompose every column of a monthly ``wide`` frame.
+
+    Returns a dict of frames shaped like ``wide``, except ``seasonal_index``
+    which is indexed by calendar month, like a precomputed ``index``.
+    """
+    if index is not None:
+        index = index[wide.columns].to_numpy().T
+    parts = decompose(wide.to_numpy().T, wide.index.month, index)
+    frames = {
+        name: pd.DataFrame(part.T, index=wide.index, columns=wide.columns)
+        for name, part in parts.items()
+        if name != "seasonal_index"
+    }
+    frames["seasonal_index"] = pd.DataFrame(
+        parts["seasonal_index"].T,
+        index=pd.RangeIndex(1, 13, name="Month"),
+        columns=wide.columns,
+    )
+    return frames
+
+
+def monthly_series(cube):
+    """Monthly totals, category revenue and expenditures side by side.
+
+    Columns are ``(scope, name)`` pairs, e.g. ``("Total", "Sales")``.
+    """
+    return pd.concat(
+        {
+            "Total": monthly_totals(cube).set_index("Month"),
+            "Product Category": monthly_by(cube, "Product Category", "Revenue_sum"),
+            "Expenditure": monthly_by(cube, "Expenditure", "Expenses_sum"),
+        },
+        axis=1,
+    )
+
+
+def stored_seasonal_index(columns):
+    """The seasonal indices of ``columns`` persisted by ``incremental.py``.
+
+    Returns ``None`` unless they are current and cover every column.
+    """
+    index = current_state("seasonal_index.parquet")
+    if index is None:
+        return None
+    keys = [key.split("|") for key in index.columns]
+    index.columns = pd.MultiIndex.from_tuples(
+        [
+            (scope, variable if scope == "Total" else name)
+            for scope, name, variable in keys
+        ]
+    )
+    if not columns.isin(index.columns).all():
+        return None
+    return index
+
+
+def load_decomposition():
+    """Decompose every ``monthly_series`` column once per dataset version."""
+
+    def build():
+        wide = monthly_series(load_cube())
+        return decompose_frame(wide, stored_seasonal_index(wide.columns))
+
+    return cached("decomposition", build, ensure_dataset())
@@ -0,0 +1,91 @@
+"""Server-side time bucketing and line downsampling for the charts.
+
+Charts receive at most about as many marks as they can draw: bar and area
+charts are summed into time buckets chosen from the visible range, and line
+charts keep the points picked by Largest-Triangle-Three-Buckets (LTTB).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Bucket frequencies from finest to coarsest, with their length in days.
+FREQUENCIES = [("D", 1), ("W", 7), ("M", 30.44), ("Q", 91.31), ("Y", 365.25)]
+MAX_BUCKETS = 120
+MAX_POINTS = 800
+
+
+def choose_frequency(times, max_buckets=MAX_BUCKETS):
+    """Finest frequency giving at most ``max_buckets`` buckets over ``times``.
+
+    Frequencies finer than the spacing of ``times`` are skipped, so monthly
+    data stays monthly whatever the visible range.
+    """
+    times = pd.Series(pd.unique(pd.Series(times).dropna())).sort_values()
+    if times.empty:
+        return FREQUENCIES[-1][0]
+    days = (times.iloc[-1] - times.iloc[0]) / pd.Timedelta(days=1)
+    spacing = times.diff().min() / pd.Timedelta(days=1) if len(times) > 1 else 0
+    for freq, length in FREQUENCIES:
+        # 0.9 lets 28-day Februaries count as monthly spacing.
+        if length >= 0.9 * spacing and days / length < max_buckets:
+            return freq
+    return FREQUENCIES[-1][0]
+
+
+def bucket(frame, time, measures, by=(), freq=None, max_buckets=MAX_BUCKETS):
+    """Sum ``measures`` of ``frame`` per ``by`` group and time bucket.
+
+    ``freq`` defaults to ``choose_frequency`` of the ``time`` column; each
+    bucket is labelled with its start.
+    """
+    freq = freq or choose_frequency(frame[time], max_buckets)
+    starts = frame[time].dt.to_period(freq).dt.start_time.rename(time)
+    return (
+        frame.groupby([*by, starts], observed=True, sort=True)[list(measures)]
+        .sum()
+        .reset_index()
+    )
+
+
+def lttb(x, y, threshold=MAX_POINTS):
+    """Indices of the ``threshold`` points of ``(x, y)`` kept by LTTB.
+
+    The first and last points are always kept; in between, each bucket keeps
+    the point forming the largest triangle with the previously kept point
+    and the mean of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    bounds = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(int) + 1
+    bounds[-1] = n - 1
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        following = slice(stop, bounds[i + 2]) if i + 3 < threshold else slice(n - 1, n)
+        cx, cy = x[following].mean(), y[following].mean()
+        area = np.abs(
+            (x[a] - cx) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (cy - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_lines(frame, x, y, by=(), threshold=MAX_POINTS):
+    """Keep at most ``threshold`` LTTB points of each ``by`` line of ``frame``."""
+    frame = frame.sort_values([*by, x], kind="stable")
+    groups = (
+        frame.groupby(list(by), observed=True, sort=False) if by else [(None, frame)]
+    )
+    kept = []
+    for _, line in groups:
+        times = line[x]
+        if pd.api.types.is_datetime64_any_dtype(times):
+            times = times.astype("int64")
+        kept.append(line.iloc[lttb(times, line[y], threshold)])
+    return pd.concat(kept).reset_index(drop=True) if kept else frame
@@ -0,0 +1,199 @@
+"""Forecast service with fitted models cached per series fingerprint.
+
+A model is refitted only when the values of its series change; forecasts
+for any horizon are then produced from the cached fit. Forecasts precomputed
+by ``batch_forecast.py`` for the same series are served without fitting, and
+so are the psi weights and residuals the prediction intervals draw from.
+"""
+
+import hashlib
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from profiling import run_in_context, span
+
+# A common starting point, but may need tuning based on AIC/BIC criteria.
+ARIMA_ORDER = (1, 1, 1)
+MODELS = ("SES", "Holt", "ARIMA")
+STORE_PATH = "data/forecasts/forecasts.parquet"
+# Forecast horizons kept per fit, least recently used evicted first.
+HORIZONS_KEPT = 8
+
+_fits = {}
+_fits_lock = threading.Lock()
+_store = {"mtime": None, "forecasts": {}, "innovations": {}}
+_store_lock = threading.Lock()
+
+
+def fingerprint(series):
+    """Hash the index and values of ``series``."""
+    hashed = pd.util.hash_pandas_object(series, index=True).values
+    return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+
+def arima_orders(order):
+    """Split an ARIMA ``order`` into ``(order, seasonal_order)``.
+
+    ``order`` is either ``(p, d, q)`` or ``((p, d, q), (P, D, Q, s))``.
+    """
+    if len(order) == 2:
+        return tuple(order[0]), tuple(order[1])
+    return tuple(order), (0, 0, 0, 0)
+
+
+def fit_model(series, model, order=ARIMA_ORDER):
+    """Fit ``model`` (one of ``MODELS``) to ``series`` without caching."""
+    # statsmodels takes most of a second to import, so it is only loaded by
+    # the first fit; forecasts served from the store never need it.
+    from statsmodels.tools.sm_exceptions import ConvergenceWarning
+    from statsmodels.tsa.arima.model import ARIMA
+    from statsmodels.tsa.holtwinters import Holt, SimpleExpSmoothing
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        if model == "SES":
+            return SimpleExpSmoothing(series, initialization_method="heuristic").fit(
+                optimized=True
+            )
+        if model == "Holt":
+            return Holt(series, initialization_method="estimated").fit(optimized=True)
+        if model == "ARIMA":
+            order, seasonal_order = arima_orders(order)
+            return ARIMA(series, order=order, seasonal_order=seasonal_order).fit()
+    raise ValueError(f"Unknown model {model!r}, expected one of {MODELS}")
+
+
+def order_key(model, order):
+    """Return the string identifying ``order`` for ``model`` in the store."""
+    return str(tuple(order)) if model == "ARIMA" else ""
+
+
+def residuals_path(store=STORE_PATH):
+    """The file of in-sample residuals written next to ``store``."""
+    root, ext = os.path.splitext(store)
+    return f"{root}_residuals{ext}"
+
+
+def _load_store():
+    # Caller holds _store_lock.
+    keys = ["fingerprint", "model", "order"]
+    frame = pd.read_parquet(STORE_PATH).sort_values("step")
+    forecasts, psi = {}, {}
+    for key, group in frame.groupby(keys):
+        forecasts[key] = group["Forecast"].to_numpy()
+        if "Psi" in group:
+            psi[key] = group["Psi"].to_numpy()
+    innovations = {}
+    if psi and os.path.exists(residuals_path()):
+        errors = pd.read_parquet(residuals_path()).sort_values("Month")
+        for key, group in errors.groupby(keys):
+            if key in psi:
+                resid = pd.Series(group["Residual"].to_numpy(), index=group["Month"])
+                innovations[key] = (psi[key], resid)
+    _store.update(forecasts=forecasts, innovations=innovations)
+
+
+def _stored(kind, series, model, order):
+    try:
+        mtime = os.stat(STORE_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _store_lock:
+        if _store["mtime"] != mtime:
+            _load_store()
+            _store["mtime"] = mtime
+        return _store[kind].get((fingerprint(series), model, order_key(model, order)))
+
+
+def stored_forecast(series, model, order=ARIMA_ORDER):
+    """Return the precomputed forecast values for ``series``, if any.
+
+    The store is reloaded whenever ``STORE_PATH`` changes on disk.
+    """
+    return _stored("forecasts", series, model, order)
+
+
+def stored_innovations(series, model, order=ARIMA_ORDER):
+    """Return the precomputed ``(psi, residuals)`` of ``series``, if any.
+
+    ``psi`` has one weight per stored forecast step and ``residuals`` is
+    indexed by month, as ``simulation.psi_weights`` and
+    ``simulation.residuals`` return them.
+    """
+    return _stored("innovations", series, model, order)
+
+
+def _entry(series, model, order):
+    # Only the latest fit per (variable, model, order) is kept, so a changed
+    # series replaces its stale fit instead of accumulating next to it.
+    key = (series.name, model, order if model == "ARIMA" else None)
+    digest = fingerprint(series)
+    with _fits_lock:
+        entry = _fits.get(key)
+        if entry is not None and entry["fingerprint"] == digest:
+            return entry
+    with span("fit", model):
+        fit = fit_model(series, model, order)
+    entry = {"fingerprint": digest, "fit": fit, "forecasts": OrderedDict()}
+    with _fits_lock:
+        _fits[key] = entry
+    return entry
+
+
+def get_fit(series, model, order=ARIMA_ORDER):
+    """Return the fitted ``model`` for ``series``, refitting only on change."""
+    return _entry(series, model, order)["fit"]
+
+
+def forecast(series, model, horizon, order=ARIMA_ORDER):
+    """Forecast ``horizon`` months after ``series`` as a one-column frame.
+
+    ``series`` must have a monthly-start ``DatetimeIndex``; the column is
+    named after the series.
+    """
+    index = pd.date_range(
+        start=series.index.max() + pd.DateOffset(months=1),
+        periods=horizon,
+        freq="MS",
+    )
+    with span("load", f"stored {model}"):
+        stored = stored_forecast(series, model, order)
+    if stored is not None and len(stored) >= horizon:
+        return pd.DataFrame({series.name: stored[:horizon]}, index=index)
+    entry = _entry(series, model, order)
+    forecasts = entry["forecasts"]
+    with _fits_lock:
+        frame = forecasts.get(horizon)
+        if frame is not None:
+            forecasts.move_to_end(horizon)
+    if frame is None:
+        values = entry["fit"].forecast(horizon)
+        frame = pd.DataFrame({series.name: list(values)}, index=index)
+        with _fits_lock:
+            forecasts[horizon] = frame
+            while len(forecasts) > HORIZONS_KEPT:
+                forecasts.popitem(last=False)
+    return frame.copy()
+
+
+def iter_forecasts(series, models, horizon, order=ARIMA_ORDER):
+    """Yield ``(model, forecast)`` pairs as each of ``models`` finishes.
+
+    Several models are fitted concurrently in a thread pool; a single model
+    is fitted in the calling thread.
+    """
+    if len(models) == 1:
+        yield models[0], forecast(series, models[0], horizon, order)
+        return
+    with ThreadPoolExecutor(max_workers=len(models)) as pool:
+        futures = {
+            run_in_context(pool, forecast, series, model, horizon, order): model
+            for model in models
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,440 @@
+"""Incremental ingest: update derived artefacts only for new or changed months.
+
+Each run lists the month partitions of the dataset, which merges the
+"Expenditure per year" sheets of every workbook, and compares their digests
+with the watermark of the previous run. A partition file is only hashed
+again when the workbook it came from changed. Only the changed months are
+queried and merged into the persisted cube and monthly totals, only the
+ratios and calendar months around them are recomputed for the seasonal
+indices, and series whose values did not change keep their stored forecasts
+and residuals. The exponential smoothing states of the others are advanced
+over the new months with their fitted parameters instead of being
+refitted; ARIMA states are re-filtered with their fitted parameters, under
+the order the prediction page tunes for the totals. Forecasts from the
+updated states are written to the forecast store with their psi weights and
+residuals. The dashboard reads the cube, totals and seasonal indices back
+(``state.current_state``).
+
+Run ``python incremental.py [--refit]`` after a workbook changes or is added.
+"""
+
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from statsmodels.tsa.arima.model import ARIMA
+
+import query
+from aggregates import DIMENSIONS, MEASURES
+from batch_forecast import (
+    HORIZON,
+    arima_order,
+    build_series,
+    forecast_rows,
+    residual_rows,
+    write_store,
+)
+from dataset import partitions, source_versions
+from forecast import (
+    ARIMA_ORDER,
+    MODELS,
+    STORE_PATH,
+    arima_orders,
+    fingerprint,
+    fit_model,
+    order_key,
+    residuals_path,
+)
+from simulation import psi_weights, residuals, smoothing_psi
+from state import read_state, write_state
+
+
+def _month(values):
+    return pd.DatetimeIndex(values).strftime("%Y-%m")
+
+
+def partition_digests(previous):
+    """Digest every month partition into ``{"YYYY-MM": entry}``.
+
+    An entry records the workbook owning the month, its modification time
+    and the SHA-1 of the partition file. The entry of ``previous`` is kept
+    while its workbook is unchanged, so only the partitions of changed
+    workbooks are read.
+    """
+    versions = {
+        os.path.splitext(os.path.basename(path))[0]: version
+        for path, version in source_versions().items()
+    }
+    digests = {}
+    for month, path in partitions().items():
+        source = os.path.splitext(os.path.basename(path))[0]
+        entry = {"source": source, "version": versions.get(source)}
+        old = previous.get(month, {})
+        if all(old.get(field) == value for field, value in entry.items()):
+            digests[month] = old
+            continue
+        with open(path, "rb") as f:
+            entry["digest"] = hashlib.sha1(f.read()).hexdigest()
+        digests[month] = entry
+    return digests
+
+
+def changed_months(previous, current):
+    """Months that were added, removed or modified since ``previous``."""
+    months = previous.keys() | current.keys()
+    return sorted(
+        m
+        for m in months
+        if previous.get(m, {}).get("digest") != current.get(m, {}).get("digest")
+    )
+
+
+def _partition_filter(months):
+    """Filter selecting the dataset partitions of ``months``."""
+    where = None
+    for month in months:
+        year, number = map(int, month.split("-"))
+        match = (ds.field("year") == year) & (ds.field("month") == number)
+        where = match if where is None else where | match
+    return where
+
+
+def _merge(previous, fresh, months, index):
+    """Replace the rows of ``months`` in ``previous`` with ``fresh``."""
+    if previous is None:
+        return fresh
+    kept = previous[~_month(index(previous)).isin(months)]
+    return pd.concat([kept, fresh])
+
+
+def update_cube(cube, months):
+    """Replace the cube rows of ``months`` with a fresh aggregate of them."""
+    if not months:
+        return cube
+    where = None if cube is None else _partition_filter(months)
+    fresh = query.cube(DIMENSIONS, MEASURES, where=where)
+    cube = _merge(cube, fresh, months, lambda frame: frame["Years"])
+    return cube.sort_values(DIMENSIONS).reset_index(drop=True)
+
+
+def update_totals(totals, months):
+    """Replace the monthly totals of ``months`` with a fresh sum of them."""
+    if not months:
+        return totals
+    where = None if totals is None else _partition_filter(months)
+    fresh = query.monthly_totals(where=where).set_index("Month")
+    totals = _merge(totals, fresh, months, lambda frame: frame.index).sort_index()
+    totals.index.freq = "MS"
+    return totals
+
+
+def _key(scope, name, variable):
+    return f"{scope}|{name}|{variable}"
+
+
+def update_seasonal(wide, ratios, medians, months):
+    """Recompute ratios next to ``months`` and the medians of their months.
+
+    ``wide`` holds every series as a column; ``ratios`` and ``medians`` are
+    the previous state (``None`` on the first run). Returns the new
+    ``(ratios, medians, seasonal_index)`` frames.
+    """
+    values = wide.to_numpy()
+    positions = np.flatnonzero(_month(wide.index).isin(months))
+    full = (
+        ratios is None
+        or medians is None
+        or not wide.columns.isin(ratios.columns).all()
+        or not ratios.index.isin(wide.index).all()
+    )
+    if full:
+        # First run, a new series or removed months: recompute everything.
+        positions = np.arange(len(wide))
+    else:
+        ratios = ratios.reindex(index=wide.index, columns=wide.columns)
+    ratios = pd.DataFrame(ratios, index=wide.index, columns=wide.columns, dtype=float)
+
+    # The centered moving average of a month spans its neighbours.
+    affected = np.unique(np.concatenate([positions - 1, positions, positions + 1]))
+    inner = affected[(affected > 0) & (affected < len(wide) - 1)]
+    cma = (values[inner - 1] + 2 * values[inner] + values[inner + 1]) / 4
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios.iloc[inner] = values[inner] / cma * 100
+    ratios.iloc[[0, -1]] = np.nan
+
+    calendar = ratios.index.month
+    if full:
+        touched = range(1, 13)
+        medians = pd.DataFrame(
+            np.nan, index=pd.RangeIndex(1, 13, name="Month"), columns=wide.columns
+        )
+    else:
+        touched = sorted(set(calendar[np.clip(affected, 0, len(wide) - 1)]))
+        medians = medians.reindex(columns=wide.columns)
+    for month in touched:
+        medians.loc[month] = ratios[calendar == month].median()
+    seasonal_index = 100 * medians / medians.mean()
+    return ratios, medians, seasonal_index
+
+
+def _fit_state(series, model, order=ARIMA_ORDER):
+    """Fit ``model`` and keep only the parameters needed to advance it."""
+    fit = fit_model(series, model, order)
+    if model == "ARIMA":
+        return {"order": list(order), "params": list(map(float, fit.params))}
+    state = {
+        "alpha": float(fit.params["smoothing_level"]),
+        "initial_level": float(fit.params["initial_level"]),
+    }
+    if model == "Holt":
+        state["beta"] = float(fit.params["smoothing_trend"])
+        state["initial_trend"] = float(fit.params["initial_trend"])
+    return state
+
+
+def _smooth(state, values, start):
+    """Advance an SES/Holt state over ``values[start:]`` with fixed parameters.
+
+    Returns the one-step errors of ``values[start:]``.
+    """
+    if start == 0:
+        level, trend = state["initial_level"], state.get("initial_trend", 0.0)
+    else:
+        level, trend = state["level"], state.get("trend", 0.0)
+    errors = np.empty(len(values) - start)
+    for i, value in enumerate(values[start:]):
+        errors[i] = value - level - trend
+        level, trend = _advance(state, level, trend, value)
+    state.update(level=level, n=len(values))
+    if "beta" in state:
+        state["trend"] = trend
+    return errors
+
+
+def _advance(state, level, trend, value):
+    """One SES/Holt update of ``(level, trend)`` with the state's parameters."""
+    alpha, beta = state["alpha"], state.get("beta")
+    previous = level
+    level = alpha * value + (1 - alpha) * (level + trend)
+    if beta is not None:
+        trend = beta * (level - previous) + (1 - beta) * trend
+    return level, trend
+
+
+def _forecast_state(series, model, state, horizon):
+    """Forecast, psi weights and in-sample residuals of an ARIMA state."""
+    order, seasonal_order = arima_orders(state["order"])
+    filtered = ARIMA(series, order=order, seasonal_order=seasonal_order).filter(
+        state["params"]
+    )
+    return (
+        np.asarray(filtered.forecast(horizon)),
+        psi_weights(filtered, model, horizon),
+        residuals(filtered, model),
+    )
+
+
+def _advance_state(values, model, state, start, stored, horizon):
+    """Forecast, psi weights and residuals of an SES/Holt state from ``start``.
+
+    The residuals before ``start`` are taken from the ``stored`` residuals
+    of the previous values, so only the new months are run through the
+    recursion.
+    """
+    months = values.index
+    if start and (stored is None or months[start - 1] not in stored.index):
+        start = 0
+    errors = _smooth(state, values.to_numpy(dtype=float), start)
+    resid = pd.Series(errors, index=months[start:])
+    if start:
+        resid = pd.concat([stored[stored.index < months[start]], resid])
+    steps = np.arange(1, horizon + 1)
+    return (
+        state["level"] + steps * state.get("trend", 0.0),
+        smoothing_psi(state["alpha"], state.get("beta", 0.0), horizon),
+        resid,
+    )
+
+
+class _Store:
+    """The forecast and residual rows written by the previous run."""
+
+    def __init__(self, path=STORE_PATH):
+        self.forecasts, self.errors = {}, {}
+        if not os.path.exists(path) or not os.path.exists(residuals_path(path)):
+            return
+        frame = pd.read_parquet(path)
+        for key, group in frame.groupby(["scope", "name", "variable", "model"]):
+            self.forecasts[key] = group
+        # Identical series share a fingerprint and so their residual rows.
+        errors = pd.read_parquet(residuals_path(path)).drop_duplicates(
+            ["fingerprint", "model", "order", "Month"]
+        )
+        for key, group in errors.groupby(["fingerprint", "model", "order"]):
+            self.errors[key] = group
+
+    def rows(self, series_key, model, fit):
+        """The stored forecast and residual rows of a fit, or ``None``."""
+        forecasts = self.forecasts.get((*series_key, model))
+        errors = self.errors.get((fit["fingerprint"], model, fit["order"]))
+        if forecasts is None or errors is None:
+            return None
+        forecasts = forecasts[
+            (forecasts["fingerprint"] == fit["fingerprint"])
+            & (forecasts["order"] == fit["order"])
+        ]
+        if forecasts.empty:
+            return None
+        return forecasts.to_dict("records"), errors.to_dict("records")
+
+    def residuals(self, digest, model, order):
+        """The stored residuals of a fit as a series indexed by month."""
+        group = self.errors.get((digest, model, order))
+        if group is None:
+            return None
+        return pd.Series(group["Residual"].to_numpy(), index=group["Month"])
+
+
+def update_models(series, states, first_changed, refit=False, horizon=HORIZON):
+    """Advance every model state and return the forecast and residual rows.
+
+    Series that are new, or all series when ``refit`` is set, are fitted;
+    the others keep their parameters. A series whose values did not change
+    keeps its stored rows. When only trailing months changed the smoothing
+    recursions resume from the stored state at ``first_changed``. Also
+    returns whether any row was recomputed.
+    """
+    store = _Store()
+    rows, errors = [], []
+    recomputed = False
+    for series_key, values in series.items():
+        scope, name, variable = series_key
+        series_states = states.setdefault(_key(*series_key), {})
+        previous = series_states.get("fingerprint")
+        digest = fingerprint(values)
+        for model in MODELS:
+            state = series_states.get(model)
+            if state is not None and digest == previous and not refit:
+                fit = {
+                    "fingerprint": digest,
+                    "model": model,
+                    "order": order_key(model, state.get("order", ARIMA_ORDER)),
+                }
+                stored = store.rows(series_key, model, fit)
+                if stored is not None:
+                    rows.extend(stored[0])
+                    errors.extend(stored[1])
+                    continue
+            recomputed = True
+            try:
+                if model == "ARIMA":
+                    order = arima_order(series_key, values)
+                    if refit or state is None or tuple(state["order"]) != order:
+                        state = _fit_state(values, model, order)
+                    predicted, psi, resid = _forecast_state(
+                        values, model, state, horizon
+                    )
+                else:
+                    if refit or state is None:
+                        state, start = _fit_state(values, model), 0
+                    else:
+                        resume = state.get("n", 0)
+                        start = (
+                            resume
+                            if first_changed is not None and first_changed >= resume
+                            else 0
+                        )
+                    stored = store.residuals(previous, model, "")
+                    predicted, psi, resid = _advance_state(
+                        values, model, state, start, stored, horizon
+                    )
+            except Exception as exc:  # keep the previous state of a failed series
+                series_states.setdefault("errors", {})[model] = repr(exc)
+                continue
+            series_states[model] = state
+            fit = {
+                "fingerprint": digest,
+                "model": model,
+                "order": order_key(model, state.get("order", ARIMA_ORDER)),
+            }
+            rows.extend(
+                forecast_rows(scope, name, variable, values, fit, predicted, psi)
+            )
+            errors.extend(residual_rows(fit, resid))
+        series_states["fingerprint"] = digest
+    return rows, errors, recomputed
+
+
+def update(refit=False, horizon=HORIZON):
+    """Bring every derived artefact up to date with the workbooks.
+
+    Returns the new watermark, which records the processed months and
+    their digests.
+    """
+    started = time.perf_counter()
+    watermark = read_state("watermark.json") or {}
+    digests = partition_digests(watermark.get("months", {}))
+    months = changed_months(watermark.get("months", {}), digests)
+    if not months and not refit:
+        # A workbook was saved without changing its rows: the state is
+        # still current for the new workbook versions.
+        watermark = dict(
+            watermark, sources=source_versions(), months=digests, updated_months=[]
+        )
+        write_state(watermark, "watermark.json")
+        return watermark
+
+    cube = update_cube(read_state("cube.parquet"), months)
+    totals = update_totals(read_state("totals.parquet"), months)
+    series = build_series(cube, totals)
+    wide = pd.DataFrame({_key(*key): values for key, values in series.items()})
+
+    ratios, medians, seasonal_index = update_seasonal(
+        wide,
+        read_state("ratios.parquet"),
+        read_state("seasonal_medians.parquet"),
+        months,
+    )
+
+    month_list = list(_month(wide.index))
+    first_changed = min(
+        (month_list.index(m) for m in months if m in month_list), default=None
+    )
+    removed = any(m not in month_list for m in months)
+    states = read_state("models.json") or {}
+    rows, errors, recomputed = update_models(
+        series, states, None if removed else first_changed, refit, horizon
+    )
+
+    write_state(cube, "cube.parquet")
+    write_state(totals, "totals.parquet")
+    write_state(ratios, "ratios.parquet")
+    write_state(medians, "seasonal_medians.parquet")
+    write_state(seasonal_index, "seasonal_index.parquet")
+    write_state(states, "models.json")
+    if recomputed:
+        write_store(pd.DataFrame(rows), errors=errors)
+    watermark = {
+        "sources": source_versions(),
+        "watermark": max(digests),
+        "months": digests,
+        "updated_months": months,
+        "seconds": time.perf_counter() - started,
+    }
+    write_state(watermark, "watermark.json")
+    return watermark
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--refit", action="store_true", help="refit every model")
+    args = parser.parse_args()
+    watermark = update(refit=args.refit)
+    updated = watermark.get("updated_months", [])
+    print(
+        f"watermark {watermark.get('watermark')}, updated {len(updated)} months: {updated}"
+    )
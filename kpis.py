@@ -0,0 +1,61 @@
+"""Headline metrics of every year, computed once per dataset version.
+
+One grouped pass over the monthly totals gives each year's profit, cost,
+sales and margin with their year-over-year changes and the month-over-month
+changes of its last month. The pages look a year up in a dict instead of
+regrouping the data on every rerun; a new KPI is one more column here.
+"""
+
+import numpy as np
+
+from aggregates import load_cube, monthly_totals
+from dataset import ensure_dataset
+from profiling import span
+from utils import cached
+
+MEASURES = ["Profit", "Cost", "Sales"]
+
+
+def build_kpis(monthly):
+    """Table of KPIs indexed by year from a ``monthly_totals`` frame.
+
+    Changes are percentages, except ``margin_yoy`` which is in percentage
+    points. A change without a previous year or month is 0.
+    """
+    monthly = monthly.sort_values("Month")
+    changes = monthly[MEASURES].pct_change(fill_method=None) * 100
+    aggregations = {m.lower(): (m, "sum") for m in MEASURES}
+    aggregations.update({f"{m.lower()}_mom": (f"{m}_mom", "last") for m in MEASURES})
+    table = (
+        monthly.join(changes.add_suffix("_mom"))
+        .groupby(monthly["Month"].dt.year.rename("year"))
+        .agg(**aggregations)
+    )
+    table = table.reindex(range(table.index.min(), table.index.max() + 1))
+    totals = [m.lower() for m in MEASURES]
+    table[totals] = table[totals].fillna(0.0)
+    table["margin"] = table["profit"] / table["sales"] * 100
+    for measure in totals:
+        table[f"{measure}_yoy"] = table[measure].pct_change(fill_method=None) * 100
+    table["margin_yoy"] = table["margin"].diff()
+    return table.replace([np.inf, -np.inf], np.nan).fillna(0.0)
+
+
+def load_kpis():
+    """The KPI table of all years, built once per dataset version."""
+    return cached(
+        "kpis", lambda: build_kpis(monthly_totals(load_cube())), ensure_dataset()
+    )
+
+
+def year_kpis(year="All"):
+    """KPIs of ``year`` as a dict; ``"All"`` is the latest year."""
+
+    def build():
+        table = load_kpis()
+        lookup = table.to_dict("index")
+        lookup["All"] = lookup[table.index.max()]
+        return lookup
+
+    with span("transform", "kpis"):
+        return cached("kpi-lookup", build, ensure_dataset())[year]
@@ -0,0 +1,291 @@
+"""Automatic ARIMA order selection by a bounded parallel grid search.
+
+Candidates are evaluated in a process pool in order of increasing
+complexity. A candidate that fails to fit or converge prunes every larger
+candidate with the same differencing, and the search stops at a wall-clock
+budget, keeping the best order (lowest AIC) found so far. Winning orders are
+cached per series fingerprint.
+
+``best_order`` runs the search in a fresh interpreter running this module
+(``search_in_subprocess``), so the pool never forks the multithreaded
+Streamlit server and its workers never re-run a page script as
+``__main__``. Workers of ``serve.py`` do not search at all: the ingest
+process searches once and publishes the reports (``order_table``). Run
+``python order_search.py [--variable Sales]`` to search the order of a
+dashboard series from the command line.
+"""
+
+import argparse
+import ast
+import itertools
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import shared
+from forecast import ARIMA_ORDER, fingerprint
+
+BUDGET = 10.0
+REPORT_FIELDS = ("aic", "evaluated", "failed", "pruned", "skipped", "seconds")
+
+_orders = {}
+_running = {}
+_orders_lock = threading.Lock()
+
+
+def candidate_orders(max_p=2, max_d=1, max_q=2, seasonal=False, period=12):
+    """Return the ``((p, d, q), (P, D, Q, s))`` grid, simplest first."""
+    seasonal_orders = [(0, 0, 0, 0)]
+    if seasonal:
+        seasonal_orders += [
+            (P, D, Q, period)
+            for P, D, Q in itertools.product((0, 1), repeat=3)
+            if (P, D, Q) != (0, 0, 0)
+        ]
+    candidates = [
+        ((p, d, q), seasonal_order)
+        for p, d, q in itertools.product(
+            range(max_p + 1), range(max_d + 1), range(max_q + 1)
+        )
+        for seasonal_order in seasonal_orders
+    ]
+    return sorted(candidates, key=_complexity)
+
+
+def _complexity(candidate):
+    (p, d, q), (P, D, Q, _) = candidate
+    return p + q + P + Q, d + D
+
+
+def _dominates(candidate, failed):
+    """Whether ``candidate`` extends the failed order ``failed``."""
+    (p, d, q), (P, D, Q, s) = candidate
+    (fp, fd, fq), (fP, fD, fQ, fs) = failed
+    return (d, D, s) == (fd, fD, fs) and p >= fp and q >= fq and P >= fP and Q >= fQ
+
+
+def evaluate(series, candidate):
+    """Fit one candidate and report its AIC and convergence."""
+    from statsmodels.tools.sm_exceptions import ConvergenceWarning
+    from statsmodels.tsa.arima.model import ARIMA
+
+    order, seasonal_order = candidate
+    started = time.perf_counter()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ConvergenceWarning)
+        try:
+            fit = ARIMA(series, order=order, seasonal_order=seasonal_order).fit()
+        except Exception as exc:  # invalid orders raise from statsmodels
+            return {
+                "candidate": candidate,
+                "converged": False,
+                "aic": None,
+                "error": repr(exc),
+                "seconds": time.perf_counter() - started,
+            }
+    warned = any(issubclass(w.category, ConvergenceWarning) for w in caught)
+    return {
+        "candidate": candidate,
+        "converged": fit.mle_retvals.get("converged", True) and not warned,
+        "aic": float(fit.aic),
+        "error": None,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def search_order(series, budget=BUDGET, workers=None, **grid):
+    """Search the ARIMA order of ``series`` within ``budget`` seconds.
+
+    ``grid`` is passed to ``candidate_orders``. Returns a report with the
+    winning ``order`` (in the form accepted by ``forecast.fit_model``), its
+    AIC and counts of evaluated, failed, pruned and skipped candidates.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    levels = itertools.groupby(candidate_orders(**grid), key=_complexity)
+    results, failed = [], []
+    pruned = skipped = 0
+    overrun = False
+    # Imported before the pool starts, so forked workers do not import it
+    # again each.
+    import statsmodels.tsa.arima.model  # noqa: F401
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for _, level in levels:
+            level = list(level)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                skipped += len(level)
+                continue
+            todo = [c for c in level if not any(_dominates(c, f) for f in failed)]
+            pruned += len(level) - len(todo)
+            futures = [pool.submit(evaluate, series, c) for c in todo]
+            done, not_done = wait(futures, timeout=remaining)
+            skipped += len(not_done)
+            overrun = overrun or bool(not_done)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                if not result["converged"]:
+                    failed.append(result["candidate"])
+    finally:
+        # Shutting down only cancels queued fits; the workers of fits still
+        # running at the deadline are terminated.
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        if overrun:
+            for process in processes:
+                process.terminate()
+
+    converged = [r for r in results if r["converged"]]
+    best = min(converged, key=lambda r: r["aic"], default=None)
+    if best is None:
+        order, aic = ARIMA_ORDER, None
+    else:
+        (p, d, q), seasonal_order = best["candidate"]
+        order = (p, d, q) if seasonal_order == (0, 0, 0, 0) else best["candidate"]
+        aic = best["aic"]
+    return {
+        "order": order,
+        "aic": aic,
+        "evaluated": len(results),
+        "failed": len(failed),
+        "pruned": pruned,
+        "skipped": skipped,
+        "seconds": time.monotonic() - started,
+        "results": results,
+    }
+
+
+def search_in_subprocess(series, budget=BUDGET, **grid):
+    """Run ``search_order`` in a fresh interpreter and return its report.
+
+    The child runs this module as ``__main__`` with a single thread, so its
+    evaluation pool starts safely with any start method.
+    """
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker"],
+        input=pickle.dumps((series, budget, grid)),
+        capture_output=True,
+        check=True,
+        timeout=budget + 60,
+    )
+    return pickle.loads(result.stdout)
+
+
+def order_table(frame, budget=BUDGET):
+    """Search the order of every column of ``frame`` into an Arrow table.
+
+    One row per series holds its fingerprint, its ``order`` as a literal
+    and the counts of its report, without the per-candidate results.
+    """
+    rows = []
+    for column in frame:
+        report = search_order(frame[column], budget)
+        rows.append(
+            {
+                "fingerprint": fingerprint(frame[column]),
+                "order": repr(report["order"]),
+                **{field: report[field] for field in REPORT_FIELDS},
+            }
+        )
+    return pa.Table.from_pylist(rows)
+
+
+def _published(series):
+    table = shared.mapped("orders")
+    rows = table.filter(pc.equal(table["fingerprint"], fingerprint(series)))
+    if not rows.num_rows:
+        return None
+    report = rows.to_pylist()[0]
+    report["order"] = ast.literal_eval(report["order"])
+    return report
+
+
+def cached_search(series):
+    """Return the cached search report for ``series``, if it has finished."""
+    if shared.serving():
+        return _published(series)
+    with _orders_lock:
+        return _orders.get(fingerprint(series))
+
+
+def best_order(series, budget=BUDGET, block=False, **grid):
+    """Return the tuned ARIMA order of ``series`` without blocking.
+
+    The first call for a series starts the search in a background thread and
+    returns ``ARIMA_ORDER``; later calls return the winner once it is known.
+    With ``block`` the calling thread waits for the search, or for the one
+    already running, and its winner is returned (``ARIMA_ORDER`` if that
+    search failed). Either way the search runs in ``search_in_subprocess``. A
+    worker of ``serve.py`` returns the published order, or ``ARIMA_ORDER``
+    for a series the ingest process did not search.
+    """
+    if shared.serving():
+        report = _published(series)
+        return ARIMA_ORDER if report is None else report["order"]
+    digest = fingerprint(series)
+    with _orders_lock:
+        if digest in _orders:
+            return _orders[digest]["order"]
+        done = _running.get(digest)
+        searching = done is not None
+        if not searching:
+            done = _running[digest] = threading.Event()
+    if searching:
+        if not block:
+            return ARIMA_ORDER
+        done.wait()
+        report = cached_search(series)
+        return ARIMA_ORDER if report is None else report["order"]
+
+    def run():
+        try:
+            report = search_in_subprocess(series, budget=budget, **grid)
+        except Exception as error:  # ARIMA_ORDER is used; a later call retries
+            print(f"order search failed: {error!r}", file=sys.stderr)
+        else:
+            with _orders_lock:
+                _orders[digest] = report
+        finally:
+            with _orders_lock:
+                del _running[digest]
+            done.set()
+
+    if block:
+        run()
+        report = cached_search(series)
+        return ARIMA_ORDER if report is None else report["order"]
+    threading.Thread(target=run, name=f"order-search-{digest[:8]}", daemon=True).start()
+    return ARIMA_ORDER
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--variable", default="Sales", choices=["Sales", "Cost", "Profit"]
+    )
+    parser.add_argument("--budget", type=float, default=BUDGET)
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="read a pickled (series, budget, grid) on stdin, write the report",
+    )
+    args = parser.parse_args()
+    if args.worker:
+        series, budget, grid = pickle.load(sys.stdin.buffer)
+        pickle.dump(search_order(series, budget, **grid), sys.stdout.buffer)
+    else:
+        from views import history
+
+        report = search_order(history()[args.variable], args.budget)
+        print({k: v for k, v in report.items() if k != "results"})
@@ -1,7 +1,12 @@
 import streamlit as st
 import altair as alt
-import pandas as pd
 from utils import *
+from dataset import years
+from kpis import year_kpis
+from profiling import finish, span, start
+import precompute
+import warmup
+from views import profit_data, profit_specs
 
 st.set_page_config(
     page_title="Profit & Cost Analysis",
@@ -9,80 +14,60 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+warmup.start()
+precompute.start()
 
 alt.themes.enable("dark")
-
-data = pd.read_excel(
-    "data/baraka_hygienics_2023-24.xlsx", sheet_name="Expenditure per year"
-)
-dataframe = (
-    data.groupby("Years")
-    .apply(
-        lambda x: pd.Series(
-            {
-                "Cost": x["Total"].sum(),
-                "Sales": x["Sales"].sum(),
-                "Profit": x["Profit"].sum(),
-            }
-        ),
-        include_groups=False,
-    )
-    .reset_index()
-    .rename(columns={"Years": "Month"})
-)
+trace = start("profit")
 
 with st.sidebar:
     st.title("Profit-Cost Dashboard")
 
-    year_list = ["All"] + list(dataframe["Month"].dt.year.unique())[::-1]
+    year_list = ["All"] + years()[::-1]
 
     selected_year = st.selectbox("Select a year", year_list)
-    if selected_year != "All":
-        dataframe = dataframe[dataframe["Month"].dt.year == selected_year]
 
     selected_color_theme = st.selectbox("choose color theme", color_palettes)
 
+frames, _ = profit_data(selected_year)
+dataframe = frames["totals"]
+specs = profit_specs(selected_year, selected_color_theme)
+
 
 col = st.columns((0.2, 0.6, 0.2), gap="medium")
 
 with col[0]:
     st.markdown("#### Metrics")
 
-    def compute_metrics(df):
-        year = df["Month"].dt.year.max() if selected_year == "All" else selected_year
-
-        filtered_df = df[df["Month"].dt.year.isin([year, year - 1])]
-
-        annual_profit = (
-            filtered_df.groupby(filtered_df["Month"].dt.year)["Profit"]
-            .sum()
-            .reset_index(name="Profit")
-        )
-        annual_profit["profit_change"] = annual_profit["Profit"].pct_change() * 100
-
-        annual_cost = (
-            filtered_df.groupby(filtered_df["Month"].dt.year)["Cost"]
-            .sum()
-            .reset_index(name="Cost")
-        )
-        annual_cost["cost_change"] = annual_cost["Cost"].pct_change() * 100
-
-        return annual_profit.tail(1).fillna(0), annual_cost.tail(1).fillna(0)
-
-    metrics = compute_metrics(dataframe)
+    metrics = year_kpis(selected_year)
     st.metric(
         label="Profit",
-        value=format_number(metrics[0]["Profit"].iloc[0]),
-        delta=f"{metrics[0]['profit_change'].iloc[0]:.1f}%",
+        value=format_number(metrics["profit"]),
+        delta=f"{metrics['profit_yoy']:.1f}%",
+        help=f"Last month: {metrics['profit_mom']:+.1f}% on the month before",
     )
 
     st.metric(
         label="Cost",
-        value=format_number(metrics[1]["Cost"].iloc[0]),
-        delta=f"{metrics[1]['cost_change'].iloc[0]:.1f}%",
+        value=format_number(metrics["cost"]),
+        delta=f"{metrics['cost_yoy']:.1f}%",
+        help=f"Last month: {metrics['cost_mom']:+.1f}% on the month before",
         delta_color="inverse",
     )
 
+    st.metric(
+        label="Sales",
+        value=format_number(metrics["sales"]),
+        delta=f"{metrics['sales_yoy']:.1f}%",
+        help=f"Last month: {metrics['sales_mom']:+.1f}% on the month before",
+    )
+
+    st.metric(
+        label="Margin",
+        value=f"{metrics['margin']:.1f}%",
+        delta=f"{metrics['margin_yoy']:.1f} pp",
+    )
+
 
 with col[1]:
     st.markdown(
@@ -90,35 +75,8 @@ with col[1]:
         unsafe_allow_html=True,
     )
 
-    df_melted = dataframe.melt(id_vars="Month", var_name="Category", value_name="Value")
-
-    chart = (
-        alt.Chart(df_melted)
-        .mark_bar()
-        .encode(
-            x=alt.X("yearmonth(Month):T", title="Month"),
-            y=alt.Y("sum(Value):Q", title="Amount($)"),
-            color=alt.Color(
-                "Category:N",
-                scale=alt.Scale(scheme=selected_color_theme),
-                legend=alt.Legend(title="Category"),
-            ),
-            tooltip=[
-                alt.Tooltip("Month:T", title="Month"),
-                alt.Tooltip("Category:N", title="Category"),
-                alt.Tooltip("Value:Q", title="Amount"),
-            ],
-        )
-        .properties(
-            width=800,
-            height=400,
-        )
-        .configure_axis(labelFontSize=12, titleFontSize=14)
-        .configure_title(fontSize=18, anchor="middle")
-        .configure_legend(labelFontSize=12, titleFontSize=14)
-    )
-
-    st.altair_chart(chart, use_container_width=True)
+    with span("render", "bars"):
+        st.vega_lite_chart(specs["bars"], use_container_width=True)
 
 
 with col[2]:
@@ -145,30 +103,8 @@ with col[2]:
 _, col2, col3 = st.columns([0.1, 0.7, 0.3], gap="medium")
 
 with col2:
-    df_melted = dataframe.melt(id_vars="Month", var_name="Category", value_name="Value")
-
-    line_chart = (
-        alt.Chart(df_melted)
-        .mark_line(point=True)
-        .encode(
-            x=alt.X(
-                "Month:T", title="Month", axis=alt.Axis(format="%Y-%m", labelAngle=-45)
-            ),
-            y=alt.Y("Value:Q", title="Amount ($)"),
-            color=alt.Color(
-                "Category:N",
-                scale=alt.Scale(scheme=selected_color_theme),
-                legend=alt.Legend(title="Metric"),
-            ),
-            strokeDash=alt.StrokeDash("Category:N", legend=None),
-        )
-        .properties(
-            width=800,
-            height=300,
-        )
-        .configure_legend(titleFontSize=14, labelFontSize=12)
-    )
-    st.altair_chart(line_chart, use_container_width=True)
+    with span("render", "lines"):
+        st.vega_lite_chart(specs["lines"], use_container_width=True)
 
 
 with col3:
@@ -177,29 +113,7 @@ with col3:
         unsafe_allow_html=True,
     )
 
-    df = data.groupby("Expenditure")["Expenses"].sum().reset_index()
-    df = df.reset_index()
-    df = df.sort_values(["Expenses"], ascending=False)
-    df = df.iloc[:5, :]
-
-    donut_chart = (
-        alt.Chart(df)
-        .mark_arc(innerRadius=50)
-        .encode(
-            theta=alt.Theta(field="Expenses", type="quantitative"),
-            color=alt.Color(
-                field="Expenditure",
-                type="nominal",
-                legend=alt.Legend(title="Expenditure Type"),
-                scale=alt.Scale(scheme=selected_color_theme),
-            ),
-            tooltip=["Expenditure", "Expenses"],
-        )
-        .properties(
-            width=700,
-            height=250,
-        )
-        .configure_legend(titleFontSize=12, labelFontSize=10)
-    )
+    with span("render", "donut"):
+        st.vega_lite_chart(specs["donut"], use_container_width=True)
 
-    st.altair_chart(donut_chart, use_container_width=True)
+finish(trace)
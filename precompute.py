@@ -0,0 +1,181 @@
+"""Background scheduler that warms the caches before the pages need them.
+
+``start()`` runs a daemon thread in the Streamlit server process. It checks
+the workbooks every ``POLL_SECONDS`` and, when one is added, removed or
+modified (or ``REFRESH_SECONDS`` after the last run), rebuilds the dataset
+and fills the in-process caches with the page frames, chart specs, KPIs,
+decompositions, correlograms, tuned ARIMA orders and model fits of every
+year and variable. The first page load after a data update then finds
+everything cached. Workers of ``serve.py`` take the tuned orders published
+by the ingest process instead of searching.
+
+``status()`` reports the jobs of the latest run; it is also written to
+``data/metrics/precompute.json`` and shown on the dashboard with
+``?debug=1``. ``python precompute.py`` runs the jobs once in the foreground,
+which rebuilds the on-disk dataset and snapshots; ``--watch`` keeps polling.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import threading
+import time
+
+import shared
+import views
+from correlogram import load_correlogram
+from dataset import ensure_dataset, sources, years
+from decompose import load_decomposition
+from forecast import MODELS, get_fit
+from kpis import year_kpis
+from order_search import best_order
+from query import SPARKLINE_WINDOWS
+from simulation import cost_shares
+from utils import atomic_path, color_palettes
+
+POLL_SECONDS = 30
+REFRESH_SECONDS = 6 * 3600
+STATUS_PATH = "data/metrics/precompute.json"
+
+_thread = None
+_lock = threading.Lock()
+_status = {"state": "idle", "runs": 0, "version": None, "jobs": {}}
+
+
+def workbook_versions():
+    """Modification times of the workbooks, the trigger of a run.
+
+    Workers of ``serve.py`` watch the shared tables instead, which the
+    ingest process republishes after a workbook changes.
+    """
+    paths = [shared.MANIFEST] if shared.serving() else sources()
+    return {path: os.stat(path).st_mtime_ns for path in paths}
+
+
+def _aggregates():
+    # The cache keys of the page reruns: page frames, sparklines, chart
+    # datasets and the specs of the default color theme.
+    theme = color_palettes[0]
+    for year in ["All"] + years():
+        views.profit_specs(year, theme)
+        views.product_specs(year, theme)
+        for window in SPARKLINE_WINDOWS:
+            views.sparkline_data(window, year)
+
+
+def _kpis():
+    for year in ["All"] + years():
+        year_kpis(year)
+
+
+def _decompositions():
+    load_decomposition()
+    load_correlogram()
+    cost_shares()
+
+
+def _forecasts():
+    history = views.history()
+    for var in views.VARIABLES:
+        order = best_order(history[var], block=True)
+        for model in MODELS:
+            get_fit(history[var], model, order)
+
+
+JOBS = {
+    "dataset": ensure_dataset,
+    "aggregates": _aggregates,
+    "kpis": _kpis,
+    "decompositions": _decompositions,
+    "forecasts": _forecasts,
+}
+
+
+def _write_status():
+    with atomic_path(STATUS_PATH) as tmp:
+        with open(tmp, "w") as f:
+            json.dump(status(), f, indent=1)
+
+
+def _update(job=None, **fields):
+    with _lock:
+        target = _status if job is None else _status["jobs"][job]
+        target.update(fields)
+    _write_status()
+
+
+def run(version=None):
+    """Run every job in order; a failed job does not stop the others."""
+    with _lock:
+        _status.update(state="running", started=time.time(), version=version)
+        _status["jobs"] = {name: {"state": "pending"} for name in JOBS}
+    for name, job in JOBS.items():
+        started = time.perf_counter()
+        _update(name, state="running", started=time.time())
+        try:
+            job()
+        except Exception as error:
+            result = {"state": "failed", "error": repr(error)}
+        else:
+            result = {"state": "done"}
+        _update(name, seconds=time.perf_counter() - started, **result)
+    with _lock:
+        _status["runs"] += 1
+    _update(state="idle", finished=time.time())
+    return status()
+
+
+def _loop():
+    version, last_run = None, None
+    while True:
+        try:
+            current = workbook_versions()
+            due = last_run is None or time.time() - last_run >= REFRESH_SECONDS
+            if current != version or due:
+                run(current)
+                version, last_run = current, time.time()
+        except Exception as error:  # e.g. a workbook being replaced; poll again
+            print(f"precompute failed: {error!r}", file=sys.stderr)
+        time.sleep(POLL_SECONDS)
+
+
+def start():
+    """Start the scheduler once per process."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, name="precompute", daemon=True)
+            _thread.start()
+    return _thread
+
+
+def status():
+    """A copy of the scheduler state and the jobs of its latest run."""
+    with _lock:
+        return copy.deepcopy(_status)
+
+
+def show_status():
+    """Dashboard expander listing the jobs of the latest run."""
+    import pandas as pd
+    import streamlit as st
+
+    current = status()
+    with st.expander("Background precompute", expanded=True):
+        st.caption(f"{current['state']}, {current['runs']} runs finished")
+        st.dataframe(
+            pd.DataFrame.from_dict(current["jobs"], orient="index"),
+            use_container_width=True,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--watch", action="store_true", help="keep polling")
+    args = parser.parse_args()
+    if args.watch:
+        _loop()
+    for name, job in run(workbook_versions())["jobs"].items():
+        print(f"{name}: {job['state']} in {job['seconds']:.2f}s {job.get('error', '')}")
@@ -0,0 +1,258 @@
+"""Timed spans of each page rerun, with a debug panel and metrics export.
+
+A page calls ``start(page)`` first and ``finish(trace)`` last; code in
+between wraps its load, transform, fit and render stages in ``span``. Spans
+outside a rerun (the CLIs, worker processes) cost one context lookup.
+
+The running totals of the process, with the ``result_cache`` counters, are
+written in the Prometheus text format to ``data/metrics/baraka-<worker>.prom``
+for a node exporter textfile collector. ``<worker>`` is ``BARAKA_WORKER``,
+set per worker by ``serve.py``, or else the process id; every series carries
+it as a ``worker`` label. The file is removed when the process exits, and
+files of process ids that are no longer running are removed on the first
+export. With ``BARAKA_TIMINGS_LOG=1`` each finished rerun is also appended
+to ``data/metrics/timings.jsonl``, which is rotated to ``timings.jsonl.1``
+at ``LOG_BYTES``. Both files are written by a background thread, off the
+render path. Open a page with ``?debug=1`` to show the breakdown in the
+sidebar.
+"""
+
+import atexit
+import contextvars
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import result_cache
+from utils import atomic_path
+
+METRICS_DIR = "data/metrics"
+LOG_PATH = os.path.join(METRICS_DIR, "timings.jsonl")
+LOG_BYTES = 16 * 2**20
+WORKER = os.environ.get("BARAKA_WORKER") or str(os.getpid())
+STAGES = ("load", "transform", "fit", "render")
+PROMETHEUS = {
+    "stage": ("baraka_stage_seconds_total", "Time spent per page and stage."),
+    "reruns": ("baraka_reruns_total", "Finished page reruns."),
+    "seconds": ("baraka_rerun_seconds_total", "Wall time of finished page reruns."),
+}
+CACHE_METRICS = {
+    "hits": ("counter", "Result cache hits in memory."),
+    "disk_hits": ("counter", "Result cache hits on disk."),
+    "misses": ("counter", "Result cache builds."),
+    "evictions": ("counter", "Result cache entries evicted for memory."),
+    "expirations": ("counter", "Result cache entries expired by TTL."),
+    "entries": ("gauge", "Result cache entries held."),
+    "bytes": ("gauge", "Result cache bytes held."),
+}
+
+_trace = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("parent", default=None)
+_totals = defaultdict(float)
+_totals_lock = threading.Lock()
+_exports = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def start(page):
+    """Begin the trace of one rerun of ``page``."""
+    trace = {"page": page, "started": time.perf_counter(), "spans": []}
+    _trace.set(trace)
+    _parent.set(None)
+    return trace
+
+
+@contextmanager
+def span(stage, name=""):
+    """Time the enclosed block as ``stage`` of the current rerun, if any.
+
+    Nested spans are recorded too; ``self`` excludes the time of children.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    record = {"stage": stage, "name": name, "children": 0.0}
+    token = _parent.set(record)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _parent.reset(token)
+        parent = _parent.get()
+        if parent is not None:
+            parent["children"] += seconds
+        record.update(
+            start=started - trace["started"],
+            seconds=seconds,
+            self=max(seconds - record["children"], 0.0),
+        )
+        trace["spans"].append(record)
+
+
+def run_in_context(pool, fn, *args):
+    """Submit ``fn`` to ``pool`` so its spans join the caller's rerun."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def breakdown(trace):
+    """Seconds per stage of ``trace``, excluding nested spans."""
+    stages = dict.fromkeys(STAGES, 0.0)
+    for record in trace["spans"]:
+        stages[record["stage"]] = stages.get(record["stage"], 0.0) + record["self"]
+    return stages
+
+
+def prometheus_path():
+    """The Prometheus text file of this process."""
+    return os.path.join(METRICS_DIR, f"baraka-{WORKER}.prom")
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _prune_stale():
+    """Remove the Prometheus files of process ids that are not running."""
+    for path in glob.glob(os.path.join(METRICS_DIR, "baraka-*.prom")):
+        worker = os.path.basename(path)[len("baraka-") : -len(".prom")]
+        if worker.isdigit() and not _running(int(worker)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _remove_prometheus():
+    try:
+        os.remove(prometheus_path())
+    except FileNotFoundError:
+        pass
+
+
+def _write_prometheus():
+    with _totals_lock:
+        totals = sorted(_totals.items())
+    worker = f'worker="{WORKER}"'
+    lines = []
+    for kind, (name, description) in PROMETHEUS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+        for (metric, page, stage), value in totals:
+            if metric == kind:
+                labels = f'{worker},page="{page}"' + (
+                    f',stage="{stage}"' if stage else ""
+                )
+                lines.append(f"{name}{{{labels}}} {value}")
+    cache = result_cache.stats()
+    for key, (kind, description) in CACHE_METRICS.items():
+        name = f"baraka_cache_{key}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines.append(f"{name}{{{worker}}} {cache[key]}")
+    with atomic_path(prometheus_path()) as tmp:
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _append_log(lines):
+    """Append rerun records to the timings log, rotating it at ``LOG_BYTES``."""
+    try:
+        if os.path.getsize(LOG_PATH) >= LOG_BYTES:
+            os.replace(LOG_PATH, LOG_PATH + ".1")
+    except FileNotFoundError:
+        pass
+    with open(LOG_PATH, "a") as f:
+        f.writelines(json.dumps(line) + "\n" for line in lines)
+
+
+def _export():
+    """Write the queued reruns; runs in the export thread."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _prune_stale()
+    atexit.register(_remove_prometheus)
+    while True:
+        lines = [_exports.get()]
+        while not _exports.empty():
+            lines.append(_exports.get_nowait())
+        try:
+            if os.environ.get("BARAKA_TIMINGS_LOG"):
+                _append_log(lines)
+            _write_prometheus()
+        except OSError:  # a metrics write must not stop the exports
+            pass
+
+
+def _start_export():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_export, name="metrics", daemon=True)
+            _writer.start()
+
+
+def finish(trace):
+    """End ``trace``, export it and show the sidebar panel when requested."""
+    seconds = time.perf_counter() - trace["started"]
+    stages = breakdown(trace)
+    _trace.set(None)
+    page = trace["page"]
+    with _totals_lock:
+        for stage, value in stages.items():
+            _totals["stage", page, stage] += value
+        _totals["reruns", page, ""] += 1
+        _totals["seconds", page, ""] += seconds
+
+    _start_export()
+    _exports.put(
+        {
+            "time": time.time(),
+            "pid": os.getpid(),
+            "worker": WORKER,
+            "page": page,
+            "seconds": seconds,
+            "stages": stages,
+            "spans": trace["spans"],
+        }
+    )
+
+    import streamlit as st
+
+    if st.query_params.get("debug"):
+        show_panel(trace, seconds, stages)
+
+
+def show_panel(trace, seconds, stages):
+    """Sidebar breakdown of the rerun in ``trace``."""
+    import pandas as pd
+    import streamlit as st
+
+    with st.sidebar.expander("Timings", expanded=True):
+        st.caption(f"{trace['page']} rerun: {seconds * 1000:.0f} ms")
+        st.dataframe(
+            pd.DataFrame(
+                {"stage": list(stages), "ms": [v * 1000 for v in stages.values()]}
+            ),
+            hide_index=True,
+        )
+        spans = pd.DataFrame(trace["spans"], columns=["stage", "name", "seconds"])
+        spans["ms"] = spans.pop("seconds") * 1000
+        st.dataframe(spans, hide_index=True)
+        cache = result_cache.stats()
+        st.caption(
+            f"Result cache: {cache['entries']} entries, "
+            f"{cache['bytes'] / 2**20:.1f} of {cache['max_bytes'] / 2**20:.0f} MiB, "
+            f"{cache['hits']} hits, {cache['misses']} misses, "
+            f"{cache['evictions']} evictions"
+        )
@@ -0,0 +1,329 @@
+"""In-process queries over the partitioned dataset with Arrow's query engine.
+
+Every query scans only the columns it needs and pushes its row filter down
+to the Parquet scan, so partitions of other years are never opened and row
+groups outside the filter are skipped. Grouping and aggregation run in
+Arrow's multithreaded engine; pandas only sees the small result.
+
+Run ``python query.py --bench [--rows N]`` to compare the page queries with
+the equivalent pandas chains on a synthetic dataset, and ``python query.py
+--check`` to compare their results on one spanning two workbooks.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import shared
+from dataset import dataset_dir
+from profiling import span
+
+# Sums of all-null groups are 0, like pandas.
+SUM = pc.ScalarAggregateOptions(min_count=0)
+SPARKLINE_WINDOWS = (3, 6, 12)
+
+
+def scan(columns, where=None, years=None, source=None):
+    """Read ``columns`` of the rows matching ``where`` as an Arrow table.
+
+    ``years`` prunes whole partitions. ``source`` defaults to the dashboard
+    dataset, which is rebuilt first if a workbook changed, or to its shared
+    memory-mapped table in a worker of ``serve.py``.
+    """
+    if source is None and shared.serving():
+        dataset = ds.dataset(shared.mapped("dataset"))
+    else:
+        if source is None:
+            source = dataset_dir()
+        dataset = ds.dataset(source, format="parquet", partitioning="hive")
+    if years is not None:
+        in_years = ds.field("year").isin(list(years))
+        where = in_years if where is None else where & in_years
+    with span("load", "scan"):
+        return dataset.to_table(columns=list(columns), filter=where)
+
+
+def aggregate(table, keys, aggregations):
+    """Group ``table`` by ``keys`` and return the aggregates as a sorted frame.
+
+    ``aggregations`` maps output names to ``(column, function)`` pairs, e.g.
+    ``{"Sales": ("Revenue", "sum")}``. Each workbook's partitions carry their
+    own category dictionaries, so they are unified before grouping.
+    """
+    table = table.unify_dictionaries()
+    specs = [
+        (column, function, SUM if function == "sum" else None)
+        for column, function in aggregations.values()
+    ]
+    result = table.group_by(list(keys)).aggregate(specs)
+    names = [f"{column}_{function}" for column, function in aggregations.values()]
+    frame = result.select(list(keys) + names).to_pandas()
+    frame.columns = list(keys) + list(aggregations)
+    return frame.sort_values(list(keys), kind="stable").reset_index(drop=True)
+
+
+def cube(dimensions, measures, years=None, source=None, where=None):
+    """Sum and count of every measure per combination of ``dimensions``."""
+    aggregations = {
+        f"{measure}_{function}": (measure, function)
+        for measure in measures
+        for function in ("sum", "count")
+    }
+    table = scan(
+        list(dimensions) + list(measures), where=where, years=years, source=source
+    )
+    return aggregate(table, dimensions, aggregations)
+
+
+def monthly_totals(years=None, source=None, where=None):
+    """Monthly Cost, Sales and Profit."""
+    table = scan(
+        ["Years", "Total", "Sales", "Profit"], where=where, years=years, source=source
+    )
+    frame = aggregate(
+        table,
+        ["Years"],
+        {
+            "Cost": ("Total", "sum"),
+            "Sales": ("Sales", "sum"),
+            "Profit": ("Profit", "sum"),
+        },
+    )
+    return frame.rename(columns={"Years": "Month"})
+
+
+def category_revenue(years=None, source=None):
+    """Monthly revenue (``Sales``) and sale count (``Count``) per category."""
+    table = scan(
+        ["Years", "Product Category", "Revenue"],
+        where=ds.field("Product Category").is_valid(),
+        years=years,
+        source=source,
+    )
+    return aggregate(
+        table,
+        ["Years", "Product Category"],
+        {"Sales": ("Revenue", "sum"), "Count": ("Revenue", "count")},
+    )
+
+
+def top_expenditures(n=5, years=None, source=None):
+    """The ``n`` expenditure types with the largest total expenses."""
+    table = scan(
+        ["Expenditure", "Expenses"],
+        where=ds.field("Expenditure").is_valid(),
+        years=years,
+        source=source,
+    )
+    frame = aggregate(table, ["Expenditure"], {"Expenses": ("Expenses", "sum")})
+    return frame.nlargest(n, "Expenses", keep="first").reset_index(drop=True)
+
+
+def recent_category_revenue(months=6, years=None, source=None):
+    """Revenue per category (rows) and month (columns) of the last ``months``.
+
+    The latest month is found from the ``Years`` column alone; only the rows
+    of it and the ``months - 1`` months before it are then read.
+    """
+    latest = pc.max(scan(["Years"], years=years, source=source)["Years"]).as_py()
+    if latest is None:
+        return pd.DataFrame()
+    start = pd.Timestamp(latest) - pd.DateOffset(months=months - 1)
+    where = (
+        ds.field("Years") >= pa.scalar(start.to_datetime64(), pa.timestamp("ns"))
+    ) & ds.field("Product Category").is_valid()
+    table = scan(
+        ["Years", "Product Category", "Revenue"],
+        where=where,
+        years=years,
+        source=source,
+    )
+    frame = aggregate(
+        table, ["Years", "Product Category"], {"Sales": ("Revenue", "sum")}
+    )
+    return frame.pivot(index="Product Category", columns="Years", values="Sales")
+
+
+def sparklines(months=6, years=None, source=None):
+    """Monthly revenue of every category over the last ``months`` as lists.
+
+    Returns a frame of ``Product Category`` and its ``sales`` series, sorted
+    like the series in descending order, and the largest value of any series.
+    """
+    wide = recent_category_revenue(months, years, source)
+    with span("transform", "sparklines"):
+        values = wide.fillna(0).to_numpy()
+        if not values.size:
+            return pd.DataFrame({"Product Category": [], "sales": []}), 0.0
+        # Descending lexicographic order of the rows, first month first.
+        order = np.lexsort(values.T[::-1])[::-1]
+        frame = pd.DataFrame(
+            {"Product Category": wide.index[order], "sales": values[order].tolist()}
+        )
+        return frame, float(values.max())
+
+
+def _synthetic(rows, directory, seed=0):
+    """Write ``rows`` random transactions over 24 months as a hive dataset.
+
+    Each year is written as its own workbook, with category dictionaries of
+    only the labels it uses, as ``dataset.build_dataset`` writes the
+    partitions of several workbooks. 2024 has a category 2023 lacks.
+    """
+    rng = np.random.default_rng(seed)
+    categories = [f"Category {i}" for i in range(12)]
+    expenditures = [f"Expenditure {i}" for i in range(15)]
+    days = pd.date_range("2023-01-01", "2024-12-31", freq="D").to_numpy()
+    frame = pd.DataFrame(
+        {
+            "Years": pd.to_datetime(rng.choice(days, rows)).to_period("M").start_time,
+            "Expenditure": rng.choice(expenditures, rows),
+            "Expenses": rng.gamma(2.0, 500.0, rows),
+            "Total": rng.gamma(2.0, 500.0, rows),
+            "Products": rng.choice(["1L SHOWER GEL", "COCONUT OIL"], rows),
+            "Product Category": rng.choice(categories, rows),
+            "Revenue": rng.gamma(2.0, 800.0, rows),
+            "Sales": rng.gamma(2.0, 800.0, rows),
+            "Profit": rng.normal(300.0, 200.0, rows),
+        }
+    )
+    late = (frame["Years"].dt.year == 2024) & (rng.random(rows) < 0.05)
+    frame.loc[late, "Product Category"] = "Category 12"
+    for year, workbook in frame.groupby(frame["Years"].dt.year):
+        workbook = workbook.astype(
+            {"Expenditure": "category", "Product Category": "category"}
+        )
+        # One file per month, laid out like ``dataset.build_dataset`` writes it.
+        for month, part in workbook.groupby(workbook["Years"].dt.to_period("M")):
+            partition = os.path.join(
+                directory, f"year={month.year}", f"month={month.month}"
+            )
+            os.makedirs(partition)
+            part.to_parquet(
+                os.path.join(partition, f"synthetic_{year}.parquet"), index=False
+            )
+
+
+def _pandas_queries(frame, year):
+    """The page computations as the eager pandas chains they replace."""
+    frame = frame[frame["Years"].dt.year == year]
+    frame.groupby(pd.Grouper(key="Years", freq="MS"))[
+        ["Total", "Sales", "Profit"]
+    ].sum()
+    revenue = (
+        frame.groupby(["Years", "Product Category"], observed=True)["Revenue"]
+        .agg(["sum", "count"])
+        .reset_index()
+    )
+    frame.groupby("Expenditure", observed=True)["Expenses"].sum().nlargest(5)
+    end = revenue["Years"].max()
+    recent = revenue[revenue["Years"] >= end - pd.DateOffset(months=5)]
+    recent.pivot(index="Product Category", columns="Years", values="sum")
+
+
+def _engine_queries(source, year):
+    monthly_totals([year], source)
+    category_revenue([year], source)
+    top_expenditures(5, [year], source)
+    recent_category_revenue(6, [year], source)
+
+
+def benchmark(rows=1_000_000, repeat=5):
+    """Time one rerun's page queries with pandas and with the query engine.
+
+    The pandas path reads the whole dataset, as the pages used to, and the
+    engine path scans it per query. Returns the best times in seconds.
+    """
+    directory = tempfile.mkdtemp(prefix="query-bench-")
+    try:
+        source = os.path.join(directory, "dataset")
+        _synthetic(rows, source)
+        year = 2024
+
+        def run_pandas():
+            frame = ds.dataset(source, partitioning="hive").to_table().to_pandas()
+            _pandas_queries(frame, year)
+
+        timings = {}
+        for name, run in (
+            ("pandas", run_pandas),
+            ("engine", lambda: _engine_queries(source, year)),
+        ):
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - started)
+            timings[name] = best
+        return timings
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def check(rows=100_000):
+    """Compare the page queries over every year with pandas.
+
+    The synthetic dataset spans two workbooks, so the queries group
+    partitions with differing category dictionaries. Raises
+    ``AssertionError`` on a mismatch.
+    """
+    directory = tempfile.mkdtemp(prefix="query-check-")
+    try:
+        source = os.path.join(directory, "dataset")
+        _synthetic(rows, source)
+        frame = ds.dataset(source, partitioning="hive").to_table().to_pandas()
+        for column in ("Expenditure", "Product Category"):
+            frame[column] = frame[column].astype(str)
+
+        totals = frame.groupby("Years")[["Total", "Sales", "Profit"]].sum()
+        expected = totals.rename(columns={"Total": "Cost"}).rename_axis("Month")
+        pd.testing.assert_frame_equal(
+            monthly_totals(source=source).set_index("Month"), expected
+        )
+
+        revenue = (
+            frame.groupby(["Years", "Product Category"])["Revenue"]
+            .agg(Sales="sum", Count="count")
+            .reset_index()
+        )
+        engine = category_revenue(source=source)
+        engine["Product Category"] = engine["Product Category"].astype(str)
+        engine = engine.sort_values(["Years", "Product Category"], ignore_index=True)
+        pd.testing.assert_frame_equal(engine, revenue, check_dtype=False)
+
+        expenses = frame.groupby("Expenditure")["Expenses"].sum().nlargest(5)
+        engine = top_expenditures(5, source=source)
+        assert engine["Expenditure"].astype(str).tolist() == expenses.index.tolist()
+        np.testing.assert_allclose(engine["Expenses"], expenses.to_numpy())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bench", action="store_true", help="run the benchmark")
+    parser.add_argument(
+        "--check", action="store_true", help="check the queries against pandas"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    if args.check:
+        check()
+        print("queries match pandas over two workbooks")
+    elif args.bench:
+        timings = benchmark(args.rows)
+        print(
+            f"{args.rows} rows: pandas {timings['pandas']:.3f}s, "
+            f"engine {timings['engine']:.3f}s "
+            f"({timings['pandas'] / timings['engine']:.1f}x)"
+        )
+    else:
+        print(monthly_totals().to_string(index=False))
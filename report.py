@@ -0,0 +1,111 @@
+"""Export every dashboard chart and table to static files.
+
+Each view (a page for one year, or a forecast variable) is rendered for
+every color theme in its own process. Charts are written as HTML, and as
+PNG when ``vl-convert-python`` is installed; tables are written as CSV::
+
+    reports/profit/2024/tableau10/cost_sales_profit.html
+    reports/profit/2024/monthly_totals.csv
+
+Run ``python report.py [--years ...] [--themes ...] [--formats html,png,csv]``.
+"""
+
+import argparse
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import altair as alt
+
+import views
+from dataset import years
+from utils import color_palettes
+
+OUTPUT_DIR = "reports"
+FORMATS = ("html", "csv")
+HORIZON = 12
+
+
+def _charts(page, key, theme):
+    if page == "predict":
+        return views.predict_charts(key, theme, HORIZON)
+    return getattr(views, f"{page}_charts")(key, theme)
+
+
+def _tables(page, key):
+    if page == "predict":
+        return views.predict_tables(key, HORIZON)
+    return getattr(views, f"{page}_tables")(key)
+
+
+def render_view(page, key, themes, formats, output=OUTPUT_DIR):
+    """Write the charts of one view in every theme, and its tables.
+
+    ``key`` is the year of the profit and product pages, or the variable of
+    the predict page. Returns the written paths.
+    """
+    alt.themes.enable("dark")
+    directory = os.path.join(output, page, str(key))
+    written = []
+    if "csv" in formats:
+        os.makedirs(directory, exist_ok=True)
+        for name, table in _tables(page, key).items():
+            path = os.path.join(directory, f"{name}.csv")
+            table.to_csv(path, index=False)
+            written.append(path)
+    for theme in themes:
+        theme_dir = os.path.join(directory, theme)
+        for name, chart in _charts(page, key, theme).items():
+            for extension in ("html", "png"):
+                if extension not in formats:
+                    continue
+                os.makedirs(theme_dir, exist_ok=True)
+                path = os.path.join(theme_dir, f"{name}.{extension}")
+                chart.save(path)
+                written.append(path)
+    return written
+
+
+def views_to_render(selected_years=None):
+    """The ``(page, key)`` pairs of every view."""
+    keys = ["All"] + (selected_years or years())
+    return [
+        *((page, key) for page in ("profit", "product") for key in keys),
+        *(("predict", var) for var in views.VARIABLES),
+    ]
+
+
+def render(
+    selected_years=None, themes=None, formats=FORMATS, workers=None, output=OUTPUT_DIR
+):
+    """Render every view in parallel processes and return the written paths."""
+    themes = themes or color_palettes
+    written = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_view, page, key, themes, formats, output): (page, key)
+            for page, key in views_to_render(selected_years)
+        }
+        for future in as_completed(futures):
+            page, key = futures[future]
+            paths = future.result()
+            print(f"{page}/{key}: {len(paths)} files")
+            written.extend(paths)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", help="default: every year")
+    parser.add_argument("--themes", nargs="+", help="default: every color theme")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    args = parser.parse_args()
+    formats = set(args.formats.split(","))
+    if "png" in formats and importlib.util.find_spec("vl_convert") is None:
+        parser.error("PNG export needs the vl-convert-python package")
+    started = time.perf_counter()
+    written = render(args.years, args.themes, formats, args.workers, args.output)
+    print(f"{len(written)} files in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,230 @@
+"""Process-wide cache of page computations, bounded in memory.
+
+Every session of a server process shares one cache, so ten users looking at
+the same year reuse one set of frames. Entries are keyed on a tuple and a
+``version`` (a data file modification time); a newer version rebuilds the
+entry in place. The least recently used entries are evicted once the cache
+holds more than ``MAX_BYTES``, and entries unused for ``TTL`` seconds are
+dropped when ``TTL`` is set.
+
+With a ``DIRECTORY``, built values are also pickled there, so several server
+processes on one machine build each result once between them; files unused
+for ``TTL`` seconds, or beyond ``DISK_BYTES`` in total, are removed.
+
+The environment variables ``BARAKA_CACHE_MB``, ``BARAKA_CACHE_TTL`` and
+``BARAKA_CACHE_DIR`` set the defaults; ``configure`` changes them at runtime.
+``stats()`` returns the hit, miss and eviction counters.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+MAX_BYTES = int(os.environ.get("BARAKA_CACHE_MB", 512)) * 2**20
+TTL = float(os.environ.get("BARAKA_CACHE_TTL", 0)) or None
+DIRECTORY = os.environ.get("BARAKA_CACHE_DIR") or None
+DISK_BYTES = 4 * MAX_BYTES
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+# A build lock lives only while a thread builds or waits on its key.
+_build_locks = weakref.WeakValueDictionary()
+_counters = dict.fromkeys(
+    ["hits", "misses", "disk_hits", "evictions", "expirations", "oversized"], 0
+)
+_size = 0
+
+
+def configure(max_bytes=None, ttl=None, directory=None):
+    """Change the memory ceiling, TTL or disk directory, evicting as needed."""
+    global MAX_BYTES, TTL, DIRECTORY
+    with _lock:
+        if max_bytes is not None:
+            MAX_BYTES = max_bytes
+        if ttl is not None:
+            TTL = ttl or None
+        if directory is not None:
+            DIRECTORY = directory or None
+        _evict()
+
+
+def sizeof(value):
+    """Approximate bytes held by ``value``, counting frames and arrays deeply."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pa.Table, pa.RecordBatch, pa.Array)):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sizeof(k) + sizeof(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _evict():
+    # Caller holds _lock.
+    global _size
+    now = time.monotonic()
+    if TTL is not None:
+        for key in [k for k, e in _entries.items() if now - e["used"] > TTL]:
+            _size -= _entries.pop(key)["size"]
+            _counters["expirations"] += 1
+    while _size > MAX_BYTES and _entries:
+        _, entry = _entries.popitem(last=False)
+        _size -= entry["size"]
+        _counters["evictions"] += 1
+
+
+def _lookup(key, version):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or entry["version"] != version:
+            return None
+        if TTL is not None and time.monotonic() - entry["used"] > TTL:
+            return None
+        entry["used"] = time.monotonic()
+        _entries.move_to_end(key)
+        _counters["hits"] += 1
+        return entry
+
+
+def _store(key, version, value):
+    global _size
+    size = sizeof(value)
+    with _lock:
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _size -= previous["size"]
+        if size > MAX_BYTES:
+            _counters["oversized"] += 1
+            return
+        _entries[key] = {
+            "version": version,
+            "value": value,
+            "size": size,
+            "used": time.monotonic(),
+        }
+        _size += size
+        _evict()
+
+
+def _disk_path(key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(DIRECTORY, f"{digest}.pkl")
+
+
+def _disk_read(key, version):
+    if DIRECTORY is None:
+        return None
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            stored_key, stored_version, value = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    if stored_key != key or stored_version != version:
+        return None
+    if TTL is not None and time.time() - os.stat(path).st_mtime > TTL:
+        return None
+    os.utime(path)
+    return value
+
+
+def _disk_write(key, version, value):
+    if DIRECTORY is None:
+        return
+    os.makedirs(DIRECTORY, exist_ok=True)
+    path = _disk_path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump((key, version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        os.remove(tmp)
+        return
+    os.replace(tmp, path)
+    _disk_prune()
+
+
+def _disk_prune():
+    files = []
+    for entry in os.scandir(DIRECTORY):
+        if entry.name.endswith(".pkl"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    now = time.time()
+    for mtime, size, path in files:
+        expired = TTL is not None and now - mtime > TTL
+        if not expired and total <= DISK_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _build_lock(key):
+    with _lock:
+        return _build_locks.setdefault(key, threading.RLock())
+
+
+def get(key, version, build):
+    """Return the cached ``build()`` for ``key`` at ``version``.
+
+    Concurrent callers of one key wait for a single build; builds of other
+    keys proceed in parallel.
+    """
+    entry = _lookup(key, version)
+    if entry is not None:
+        return entry["value"]
+    with _build_lock(key):
+        entry = _lookup(key, version)
+        if entry is not None:
+            return entry["value"]
+        value = _disk_read(key, version)
+        with _lock:
+            _counters["disk_hits" if value is not None else "misses"] += 1
+        if value is None:
+            value = build()
+            _disk_write(key, version, value)
+        _store(key, version, value)
+        return value
+
+
+def clear():
+    """Drop every in-memory entry; the counters and disk files are kept."""
+    global _size
+    with _lock:
+        _entries.clear()
+        _size = 0
+
+
+def stats():
+    """Counters, entry count, bytes held and the configured limits."""
+    with _lock:
+        return {
+            **_counters,
+            "entries": len(_entries),
+            "bytes": _size,
+            "max_bytes": MAX_BYTES,
+            "ttl": TTL,
+            "directory": DIRECTORY,
+        }
@@ -0,0 +1,116 @@
+"""Serve the dashboard from several processes sharing one copy of the data.
+
+This process is the single ingest process: it rebuilds the dataset, builds
+the aggregate cube, tunes the ARIMA order of every forecast variable and
+publishes them as memory-mapped Arrow files (see ``shared.py``), then
+starts ``--workers`` Streamlit servers on consecutive ports from ``--port``
+with ``BARAKA_SERVING=shared``. The workers never read the Parquet
+partitions or the workbooks; they map the published tables read-only, and
+they read the tuned orders instead of searching. The workers share
+``CACHE_DIR`` (unless ``BARAKA_CACHE_DIR`` is set), so their background
+precompute builds each page result once between them. Each worker exports
+its metrics under its port (``BARAKA_WORKER``, see ``profiling.py``). When a workbook
+changes, the tables are republished and every worker picks up the new
+version on its next rerun. If republishing fails, for example on a
+half-saved workbook, the workers keep the previous tables and the next poll
+tries again.
+
+Put the ports behind a load balancer with sticky sessions (for example an
+nginx ``upstream`` with ``ip_hash``), since a Streamlit session lives in
+one worker.
+
+Run ``python serve.py --workers N [--port 8501]``.
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import query
+import shared
+from aggregates import DIMENSIONS, MEASURES
+from dataset import dataset_dir, ensure_dataset
+from order_search import order_table
+from precompute import POLL_SECONDS, workbook_versions
+from transactions import load_transactions
+
+APP = "Dashboard.py"
+PORT = 8501
+CACHE_DIR = "data/cache"
+
+
+def publish():
+    """Rebuild the dataset if needed; publish it, its cube, orders and transactions."""
+    version = os.stat(ensure_dataset()).st_mtime_ns
+    dataset = ds.dataset(dataset_dir(), format="parquet", partitioning="hive")
+    cube = query.cube(DIMENSIONS, MEASURES)
+    history = query.monthly_totals().set_index("Month")
+    history.index.freq = "MS"
+    return shared.write_tables(
+        {
+            "dataset": dataset.to_table(),
+            "cube": pa.Table.from_pandas(cube, preserve_index=False),
+            "orders": order_table(history),
+            "transactions": pa.Table.from_pandas(
+                load_transactions(), preserve_index=False
+            ),
+        },
+        version,
+    )
+
+
+def launch(workers, port=PORT):
+    """Start ``workers`` Streamlit servers reading the shared tables."""
+    env = {"BARAKA_CACHE_DIR": CACHE_DIR, **os.environ, "BARAKA_SERVING": "shared"}
+    return [
+        subprocess.Popen(
+            [
+                *(sys.executable, "-m", "streamlit", "run", APP),
+                *("--server.port", str(port + i), "--server.headless", "true"),
+            ],
+            env={**env, "BARAKA_WORKER": f"port-{port + i}"},
+        )
+        for i in range(workers)
+    ]
+
+
+def serve(workers, port=PORT):
+    """Publish, launch the workers and republish on workbook changes."""
+    publish()
+    version = workbook_versions()
+    processes = launch(workers, port)
+    print(f"{workers} workers on ports {port}-{port + workers - 1}")
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(POLL_SECONDS)
+            current = workbook_versions()
+            if current != version:
+                try:
+                    publish()
+                except Exception as error:  # keep serving the last tables
+                    print(f"republishing failed: {error!r}", file=sys.stderr)
+                    continue
+                version = current
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    if shared.serving():
+        parser.error("unset BARAKA_SERVING; this is the ingest process")
+    # Stopping the ingest process stops its workers too.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    serve(args.workers, args.port)
@@ -0,0 +1,87 @@
+"""Memory-mapped Arrow tables shared by the worker processes of ``serve.py``.
+
+The ingest process writes each table as an uncompressed Arrow IPC file under
+``data/shared/`` and then replaces ``_manifest.json``, which names the files
+of the current version. Workers started with ``BARAKA_SERVING=shared`` map
+those files read-only: the tables point straight into the page cache, so
+every worker reads the same physical pages and adding workers does not add
+copies of the data. A new version gets new file names, and the files of a
+version are removed by a later publish once it has been superseded for
+``GRACE_SECONDS``, like the versions of ``dataset.py``, so a worker that
+read the previous manifest can still map them.
+"""
+
+import json
+import os
+import threading
+import time
+
+import pyarrow as pa
+
+from utils import atomic_path
+
+SHARED_DIR = "data/shared"
+MANIFEST = os.path.join(SHARED_DIR, "_manifest.json")
+GRACE_SECONDS = 300
+
+_mapped = {"mtime": None, "tables": {}}
+_lock = threading.Lock()
+
+
+def serving():
+    """Whether this process is a worker reading the shared tables."""
+    return os.environ.get("BARAKA_SERVING") == "shared"
+
+
+def write_tables(tables, version):
+    """Publish ``tables`` (name to Arrow table) as version ``version``.
+
+    Dictionary columns are unified and every table is written as a single
+    record batch, so a worker maps each column as one contiguous buffer.
+    """
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    files = {}
+    for name, table in tables.items():
+        table = table.unify_dictionaries().combine_chunks()
+        files[name] = f"{name}-{version}.arrow"
+        with atomic_path(os.path.join(SHARED_DIR, files[name])) as tmp:
+            with pa.OSFile(tmp, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    with atomic_path(MANIFEST) as tmp:
+        with open(tmp, "w") as f:
+            json.dump({"version": version, "files": files}, f, indent=1)
+    _prune(version)
+    return MANIFEST
+
+
+def _prune(current):
+    """Remove the versions superseded more than ``GRACE_SECONDS`` ago."""
+    versions = {}
+    for name in os.listdir(SHARED_DIR):
+        if name.endswith(".arrow"):
+            version = int(name[: -len(".arrow")].rsplit("-", 1)[1])
+            versions.setdefault(version, []).append(os.path.join(SHARED_DIR, name))
+    ordered = sorted(versions)
+    cutoff = time.time() - GRACE_SECONDS
+    # A version was superseded when the files of the next one were written.
+    for version, successor in zip(ordered, ordered[1:]):
+        written = min(os.stat(path).st_mtime for path in versions[successor])
+        if version != current and written < cutoff:
+            for path in versions[version]:
+                os.remove(path)
+
+
+def mapped(name):
+    """The shared table ``name`` of the current version, mapped read-only."""
+    mtime = os.stat(MANIFEST).st_mtime_ns
+    with _lock:
+        if _mapped["mtime"] != mtime:
+            with open(MANIFEST) as f:
+                files = json.load(f)["files"]
+            tables = {}
+            for key, file in files.items():
+                source = pa.memory_map(os.path.join(SHARED_DIR, file), "r")
+                tables[key] = pa.ipc.open_file(source).read_all()
+            _mapped.update(mtime=mtime, tables=tables)
+        return _mapped["tables"][name]
@@ -0,0 +1,139 @@
+"""Prediction intervals and what-if scenarios from bootstrapped forecast paths.
+
+SES, Holt and ARIMA are all linear in their one-step errors: the forecast
+error ``h`` months ahead is ``sum(psi[j] * e[h - j])``. Paths are drawn by
+resampling the in-sample residuals into a ``(paths, horizon)`` array and
+multiplying it by the lower-triangular matrix of ``psi`` weights, so
+thousands of 12-month paths cost one matrix product. The weights and
+residuals come from the forecast store when ``batch_forecast.py`` wrote
+them for the series, so the intervals need no fit.
+
+A scenario scales simulated paths, e.g. ``{"Cost": 0.15}`` with the
+``RAW MATERIALS`` expenditure raises the cost by 15% of that expenditure's
+share of the cost. Sales, cost and profit are simulated from the same
+resampled months, so a scenario keeps their correlation.
+"""
+
+import numpy as np
+import pandas as pd
+
+from aggregates import load_cube, monthly_by
+from dataset import ensure_dataset
+from forecast import ARIMA_ORDER, forecast, get_fit, stored_innovations
+from profiling import span
+from utils import cached
+
+PATHS = 2000
+LEVELS = (80, 95)
+SHOCKED = ("Sales", "Cost")
+
+
+def psi_weights(fit, model, horizon):
+    """Weights of the one-step errors in the error ``0..horizon-1`` steps on."""
+    if model == "ARIMA":
+        return np.asarray(fit.impulse_responses(horizon - 1), dtype=float)
+    beta = fit.params["smoothing_trend"] if model == "Holt" else 0.0
+    return smoothing_psi(fit.params["smoothing_level"], beta, horizon)
+
+
+def smoothing_psi(alpha, beta, horizon):
+    """``psi_weights`` of SES (``beta`` 0) or Holt from their parameters."""
+    psi = alpha * (1 + beta * np.arange(horizon))
+    psi[0] = 1.0
+    return psi
+
+
+def residuals(fit, model):
+    """In-sample one-step errors, without the ARIMA burn-in."""
+    resid = fit.resid
+    if model == "ARIMA":
+        resid = resid.iloc[fit.loglikelihood_burn :]
+    return resid
+
+
+def simulate(point, psi, errors):
+    """Paths of ``point`` given resampled ``errors`` of shape ``(paths, h)``."""
+    horizon = len(point)
+    lags = np.arange(horizon)[None, :] - np.arange(horizon)[:, None]
+    weights = np.where(lags >= 0, psi[np.clip(lags, 0, None)], 0.0)
+    return np.asarray(point, dtype=float) + errors @ weights
+
+
+def intervals(paths, levels=LEVELS):
+    """``{level: (lower, upper)}`` percentiles of ``paths`` at each step."""
+    quantiles = [q for level in levels for q in (50 - level / 2, 50 + level / 2)]
+    bounds = np.percentile(paths, quantiles, axis=0)
+    return {level: (bounds[2 * i], bounds[2 * i + 1]) for i, level in enumerate(levels)}
+
+
+def innovations(series, model, horizon, order=ARIMA_ORDER):
+    """``(psi, residuals)`` of ``model`` on ``series``, fitting only if needed."""
+    stored = stored_innovations(series, model, order)
+    if stored is not None and len(stored[0]) >= horizon:
+        psi, resid = stored
+        return psi[:horizon], resid
+    fit = get_fit(series, model, order)
+    return psi_weights(fit, model, horizon), residuals(fit, model)
+
+
+def cost_shares():
+    """Share of the total cost spent on each expenditure, largest first."""
+
+    def build():
+        spend = monthly_by(load_cube(), "Expenditure", "Expenses_sum").abs().sum()
+        return (spend / spend.sum()).sort_values(ascending=False)
+
+    return cached("cost-shares", build, ensure_dataset())
+
+
+def cost_share(expenditures):
+    """Share of the total cost spent on ``expenditures``."""
+    return float(cost_shares()[list(expenditures)].sum())
+
+
+def simulate_forecasts(
+    history,
+    var,
+    models,
+    horizon,
+    order=ARIMA_ORDER,
+    shocks=None,
+    expenditures=None,
+    paths=PATHS,
+    seed=0,
+):
+    """Simulated paths of ``var`` per model, with and without a scenario.
+
+    ``shocks`` maps ``"Sales"`` and ``"Cost"`` to relative changes; the cost
+    change applies to the share of ``expenditures`` in the cost (all of it
+    by default). Returns ``{model: (baseline, scenario)}`` arrays of shape
+    ``(paths, horizon)``; ``scenario`` is None without shocks.
+    """
+    shocks = {k: v for k, v in (shocks or {}).items() if v}
+    share = cost_share(expenditures) if expenditures else 1.0
+    rng = np.random.default_rng(seed)
+    simulated = {}
+    with span("transform", "simulate"):
+        for model in models:
+            variables = [var] + [v for v in SHOCKED if v in shocks and v != var]
+            parts = {
+                v: innovations(history[v], model, horizon, order) for v in variables
+            }
+            errors = pd.concat(
+                {v: resid for v, (_, resid) in parts.items()}, axis=1
+            ).dropna()
+            months = rng.integers(0, len(errors), size=(paths, horizon))
+            series = {}
+            for v, (psi, _) in parts.items():
+                point = forecast(history[v], model, horizon, order)[v].to_numpy()
+                draws = errors[v].to_numpy()[months]
+                series[v] = simulate(point, psi, draws)
+            baseline = series[var]
+            scenario = None
+            if shocks:
+                sales = shocks.get("Sales", 0.0) * series.get("Sales", 0.0)
+                cost = shocks.get("Cost", 0.0) * share * series.get("Cost", 0.0)
+                change = {"Sales": sales, "Cost": cost, "Profit": sales - cost}
+                scenario = baseline + change[var]
+            simulated[model] = (baseline, scenario)
+    return simulated
@@ -0,0 +1,90 @@
+"""Compile the Excel workbooks into typed Parquet snapshots.
+
+Run ``python snapshot.py [workbook ...]`` to (re)build the snapshots for the
+given workbooks, or for every ``data/*.xlsx`` when none are given.
+"""
+
+import glob
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import atomic_path
+
+SOURCE_GLOB = "data/*.xlsx"
+SNAPSHOT_DIR = "data/snapshots"
+SHEET_NAME = "Expenditure per year"
+
+# Column dtypes of the "Expenditure per year" sheet.
+SCHEMA = {
+    "Years": "datetime64[ns]",
+    "Expenditure": "category",
+    "Expenses Category": "category",
+    "Expenses": "float64",
+    "Total": "float64",
+    "Products": "string",
+    "Product Category": "category",
+    "Revenue": "float64",
+    "Sales": "float64",
+    "Profit": "float64",
+}
+
+
+def snapshot_path(source, sheet_name=SHEET_NAME):
+    """Return the snapshot file compiled from ``source``/``sheet_name``."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    sheet = sheet_name.lower().replace(" ", "_")
+    return os.path.join(SNAPSHOT_DIR, f"{stem}__{sheet}.parquet")
+
+
+def coerce(frame):
+    """Cast a raw sheet to ``SCHEMA``, trimming stray whitespace in labels."""
+    frame = frame.copy()
+    for column, dtype in SCHEMA.items():
+        if column not in frame:
+            continue
+        if dtype == "category":
+            frame[column] = frame[column].str.strip().astype("category")
+        elif dtype.startswith("datetime"):
+            frame[column] = pd.to_datetime(frame[column]).astype(dtype)
+        else:
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+def build_snapshot(source, sheet_name=SHEET_NAME):
+    """Parse ``source`` and atomically write its typed Parquet snapshot."""
+    target = snapshot_path(source, sheet_name)
+    frame = coerce(pd.read_excel(source, sheet_name=sheet_name))
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    with atomic_path(target) as tmp:
+        pq.write_table(table, tmp)
+    return target
+
+
+def is_stale(source, sheet_name=SHEET_NAME):
+    """Whether the snapshot is missing or older than its source workbook."""
+    target = snapshot_path(source, sheet_name)
+    if not os.path.exists(target):
+        return True
+    return os.stat(source).st_mtime_ns > os.stat(target).st_mtime_ns
+
+
+def ensure_snapshot(source, sheet_name=SHEET_NAME):
+    """Return an up-to-date snapshot path, rebuilding it if needed."""
+    if is_stale(source, sheet_name):
+        return build_snapshot(source, sheet_name)
+    return snapshot_path(source, sheet_name)
+
+
+def read_snapshot(source, sheet_name=SHEET_NAME, columns=None):
+    """Read the snapshot of ``source``, rebuilding it when the source is newer."""
+    return pd.read_parquet(ensure_snapshot(source, sheet_name), columns=columns)
+
+
+if __name__ == "__main__":
+    for source in sys.argv[1:] or sorted(glob.glob(SOURCE_GLOB)):
+        print(f"{source} -> {build_snapshot(source)}")
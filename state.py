@@ -0,0 +1,57 @@
+"""Persisted state of the incremental ingest (``incremental.py``).
+
+The cube, monthly totals, seasonal ratios and indices and the model states
+live in ``data/state/`` next to a watermark recording the workbook versions
+they were computed from. The dashboard reuses a state file instead of
+recomputing it while that watermark matches the current workbooks.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+import shared
+from dataset import source_versions
+from utils import atomic_path
+
+STATE_DIR = "data/state"
+
+
+def state_path(name):
+    return os.path.join(STATE_DIR, name)
+
+
+def write_state(frame_or_dict, name):
+    """Atomically write a state file, Parquet for frames and JSON otherwise."""
+    with atomic_path(state_path(name)) as tmp:
+        if isinstance(frame_or_dict, pd.DataFrame):
+            frame_or_dict.to_parquet(tmp)
+        else:
+            with open(tmp, "w") as f:
+                json.dump(frame_or_dict, f, indent=1, default=float)
+
+
+def read_state(name):
+    """Return a state file, or ``None`` if the ingest has not written it."""
+    target = state_path(name)
+    if not os.path.exists(target):
+        return None
+    if target.endswith(".parquet"):
+        return pd.read_parquet(target)
+    with open(target) as f:
+        return json.load(f)
+
+
+def current_state(name):
+    """Return a state file if it was computed from the current workbooks.
+
+    Returns ``None`` when the watermark is missing or older than a workbook,
+    and in the workers of ``serve.py``, which read the shared tables.
+    """
+    if shared.serving():
+        return None
+    watermark = read_state("watermark.json") or {}
+    if watermark.get("sources") != source_versions():
+        return None
+    return read_state(name)
@@ -0,0 +1,289 @@
+"""Compact, typed store of the individual sales and expense transactions.
+
+The monthly sheets of the workbook ("JUN 2024", " JAN 2024", ...) list every
+payment received and every expense paid. They are parsed once into a frame
+with the schema below and cached as a Parquet snapshot next to the others.
+Labels are dictionary-encoded, dates are integer keys and amounts float32,
+so one process holds a single small copy that every page can aggregate.
+``load_transactions()`` combines the store of every workbook the way the
+dataset combines their yearly sheets, and the report aggregates the sales
+by payment channel from the columns ``select_transactions()`` reads
+(``channel_sales``).
+
+Run ``python transactions.py [workbook ...]`` to rebuild the snapshots.
+
+Schema, one row per transaction:
+
+===============  ===============  ========================================
+column           dtype            meaning
+===============  ===============  ========================================
+``ref``          string[pyarrow]  payment reference (``REF NO``)
+``date``         int32            day as ``YYYYMMDD``
+``kind``         category         ``"sale"`` or ``"expense"``
+``channel``      category         payment type, e.g. ``"Funds received"``
+``product``      category         product sold, without a leading count
+``expenditure``  category         expense type, e.g. ``"RENT"``
+``quantity``     int16            leading count of the description, else 1
+``amount``       float32          amount paid, negative for expenses
+===============  ===============  ========================================
+
+``product`` is missing on expenses and ``expenditure`` on sales. Expenses
+are negative even where a sheet records them with a positive sign. float32
+holds every amount of the workbooks exactly; sums are taken in float64.
+"""
+
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import shared
+from dataset import ensure_dataset, sources
+from snapshot import SHEET_NAME, is_stale, snapshot_path
+from utils import atomic_path, cached
+
+SCHEMA = {
+    "ref": "string[pyarrow]",
+    "date": "int32",
+    "kind": "category",
+    "channel": "category",
+    "product": "category",
+    "expenditure": "category",
+    "quantity": "int16",
+    "amount": "float32",
+}
+SNAPSHOT_SHEET = "transactions"
+
+# Month sheets, e.g. "JUN 2024", " MARCH 2024" or "SEPT 2023".
+MONTH_SHEET = re.compile(r"^\s*[A-Z]+\s+\d{4}\s*$")
+CHANNEL = re.compile(
+    r"^(Funds received|Business Payment|Pay Bill|Customer Transfer"
+    r"|Merchant Payment|Customer Withdrawal)",
+    re.IGNORECASE,
+)
+COUNT = re.compile(r"^(\d+)\s+(?=[A-Z])")
+HEADER = re.compile(r"^(REF NO|RECEIPT NO)", re.IGNORECASE)
+# Expense type typed after the payee, e.g. "... Acc. 186971 INTERNET".
+TRAILING_LABEL = re.compile(r"[a-z0-9.]\s+([A-Z]{2,}(?: [A-Z]{2,})*)$")
+
+
+def _role(header):
+    """Column role of a section header cell."""
+    header = str(header).strip().upper()
+    if HEADER.match(header):
+        return "ref"
+    if "DATE" in header or "TIME" in header:
+        return "date"
+    if "DETAIL" in header:
+        return "details"
+    if "DESCRIPTION" in header:
+        return "description"
+    if header.startswith(("AMOU", "COST", "WIDHRAWN", "WITHDRAWN")):
+        return "amount"
+    return None
+
+
+def _number(value):
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        return None if pd.isna(value) else float(value)
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _text(value):
+    if not isinstance(value, str) or _number(value) is not None:
+        return None
+    return " ".join(value.split()) or None
+
+
+def _label(text):
+    """Expense type of a label that may be a whole payment detail."""
+    if CHANNEL.match(text):
+        trailing = TRAILING_LABEL.search(text)
+        return trailing.group(1) if trailing else None
+    return text.split(" - ")[0]
+
+
+def parse_sheet(raw):
+    """Rows of one month sheet read with ``header=None``.
+
+    A sheet holds a sales section and an expenditure section, each under its
+    own header row whose layout varies from month to month; amounts and
+    labels are located by header name, falling back to the last number and
+    last label of the row.
+    """
+    rows = []
+    roles = {}
+    expense = False
+    for values in raw.itertuples(index=False):
+        first = str(values[0]).strip()
+        if any(str(v).strip().upper() == "EXPENDITURE" for v in values):
+            expense = True
+            continue
+        if HEADER.match(first):
+            expense = expense or bool(rows)
+            roles = {}
+            for position, header in enumerate(values):
+                roles.setdefault(_role(header), position)
+            continue
+        if pd.isna(values[0]) or "ref" not in roles:
+            continue
+
+        amount = _number(values[roles["amount"]]) if "amount" in roles else None
+        if amount is None:
+            numbers = [_number(v) for v in values[roles["date"] + 1 :]]
+            numbers = [n for n in numbers if n is not None]
+            amount = numbers[-1] if numbers else None
+        date = pd.to_datetime(
+            str(values[roles["date"]]).replace("\n", " "), errors="coerce"
+        )
+        if amount is None or pd.isna(date):
+            continue
+
+        labels = [_text(v) for v in values[roles["date"] + 1 :]]
+        labels = [label for label in labels if label]
+        details = _text(values[roles["details"]]) if "details" in roles else None
+        if "description" in roles:
+            description = _text(values[roles["description"]])
+        else:
+            description = _label(labels[-1]) if labels else None
+        if description is not None:
+            description = description.upper()
+
+        channel = CHANNEL.match(details or "")
+        count = COUNT.match(description or "")
+        kind = "expense" if expense or amount < 0 else "sale"
+        product = description[count.end() :] if count else description
+        rows.append(
+            {
+                "ref": first,
+                "date": date.year * 10000 + date.month * 100 + date.day,
+                "kind": kind,
+                "channel": channel.group(1).capitalize() if channel else None,
+                "product": product if kind == "sale" else None,
+                "expenditure": description if kind == "expense" else None,
+                "quantity": int(count.group(1)) if count else 1,
+                "amount": -abs(amount) if kind == "expense" else amount,
+            }
+        )
+    return rows
+
+
+def read_transactions(source):
+    """Parse every month sheet of ``source`` into a frame typed as ``SCHEMA``."""
+    sheets = pd.read_excel(source, sheet_name=None, header=None)
+    rows = [
+        row
+        for name, raw in sheets.items()
+        if name != SHEET_NAME and MONTH_SHEET.match(name.upper())
+        for row in parse_sheet(raw)
+    ]
+    frame = pd.DataFrame(rows, columns=list(SCHEMA)).astype(SCHEMA)
+    return frame.sort_values(["date", "ref"], kind="stable").reset_index(drop=True)
+
+
+def build_transactions(source):
+    """Parse ``source`` and atomically write its transaction snapshot."""
+    target = snapshot_path(source, SNAPSHOT_SHEET)
+    table = pa.Table.from_pandas(read_transactions(source), preserve_index=False)
+    with atomic_path(target) as tmp:
+        pq.write_table(table, tmp)
+    return target
+
+
+def load_transactions(path=None):
+    """Return the transactions of ``path``, read once per workbook version.
+
+    Without ``path`` the transactions of every workbook are combined; a
+    month covered by several workbooks is taken from the last one, like in
+    the dataset. Every caller shares the cached frame through a read-only
+    view; workers of ``serve.py`` read the published table through
+    ``select_transactions`` instead.
+    """
+    if path is None:
+        return cached("transactions", _combined, ensure_dataset()).copy(deep=False)
+
+    def build():
+        if is_stale(path, SNAPSHOT_SHEET):
+            build_transactions(path)
+        frame = pd.read_parquet(snapshot_path(path, SNAPSHOT_SHEET))
+        return frame.astype(SCHEMA)
+
+    return cached("transactions", build, path).copy(deep=False)
+
+
+def select_transactions(year=None, columns=None):
+    """The ``columns`` (all when ``None``) of the transactions of ``year``.
+
+    Workers of ``serve.py`` select the rows and columns on the mapped table
+    and convert only those to pandas.
+    """
+    if not shared.serving():
+        store = load_transactions()
+        if year is not None:
+            store = store[store["date"] // 10000 == year]
+        return store if columns is None else store[list(columns)]
+    table = shared.mapped("transactions")
+    selected = table if columns is None else table.select(list(columns))
+    if year is not None:
+        date = table["date"]
+        selected = selected.filter(
+            pc.and_(
+                pc.greater_equal(date, year * 10000),
+                pc.less(date, (year + 1) * 10000),
+            )
+        )
+    return selected.to_pandas()
+
+
+def _combined():
+    frames = [load_transactions(source) for source in sources()]
+    if not frames:
+        return pd.DataFrame(columns=list(SCHEMA)).astype(SCHEMA)
+    frame = pd.concat(frames, keys=range(len(frames)), names=["source", None])
+    frame = frame.reset_index(level="source")
+    month = frame["date"] // 100
+    last = frame.groupby(month)["source"].transform("max")
+    frame = frame[frame["source"] == last].drop(columns="source").astype(SCHEMA)
+    return frame.sort_values(["date", "ref"], kind="stable").reset_index(drop=True)
+
+
+def dates(store):
+    """The ``date`` keys of ``store`` as timestamps."""
+    key = store["date"].to_numpy()
+    return pd.to_datetime(
+        pd.DataFrame(
+            {"year": key // 10000, "month": key // 100 % 100, "day": key % 100},
+            index=store.index,
+        )
+    )
+
+
+def channel_sales(store):
+    """Sales and their count per month and payment channel, largest first."""
+    sales = store[store["kind"] == "sale"]
+    month = dates(sales).dt.to_period("M").dt.start_time.rename("Month")
+    return (
+        sales["amount"]
+        .astype("float64")
+        .groupby([month, sales["channel"]], observed=True, dropna=False)
+        .agg(Sales="sum", Count="count")
+        .reset_index()
+        .rename(columns={"channel": "Channel"})
+        .sort_values(["Month", "Sales"], ascending=[True, False], kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+if __name__ == "__main__":
+    for source in sys.argv[1:] or sources():
+        target = build_transactions(source)
+        frame = pd.read_parquet(target).astype(SCHEMA)
+        kib = frame.memory_usage(deep=True).sum() / 1024
+        print(f"{source} -> {target}: {len(frame)} rows, {kib:.0f} KiB in memory")
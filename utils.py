@@ -1,3 +1,64 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+import result_cache
+
+# Copy-on-write lets every page share the cached frames below; any page-level
+# mutation then copies the touched columns instead of altering the cache.
+pd.set_option("mode.copy_on_write", True)
+
+DATA_PATH = "data/baraka_hygienics_2023-24.xlsx"
+
+
+def data_version(path=DATA_PATH):
+    """Return the (path, mtime) token identifying the current workbook."""
+    path = os.path.abspath(path)
+    return path, os.stat(path).st_mtime_ns
+
+
+def cached(kind, build, path, *extra):
+    """Memoize ``build()`` per workbook version, replacing superseded results.
+
+    Entries are keyed on ``kind``, the workbook path and ``extra``; a newer
+    workbook modification time rebuilds the entry in place. They live in the
+    process-wide ``result_cache``, shared by every session and bounded in
+    memory.
+    """
+    path, mtime = data_version(path)
+    return result_cache.get((kind, path) + extra, mtime, build)
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path that replaces ``path`` when the block succeeds.
+
+    Readers see the old file or the new one, never a partial write; the
+    temporary file is removed if the block raises. The parent directory is
+    created as needed. A directory may be written at the temporary path
+    only when ``path`` does not exist yet; directories cannot be replaced
+    atomically.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp
+    except BaseException:
+        _remove(tmp)
+        raise
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
 def format_number(num):
     if num > 1000000:
         if not num % 1000000:
@@ -0,0 +1,440 @@
+"""The computations behind each dashboard page, callable without Streamlit.
+
+The pages render what these functions return, and ``report.py`` exports the
+same charts and tables to files. ``year`` is a year or ``"All"``. The page
+aggregates are pushdown queries on the dataset (see ``query.py``).
+"""
+
+import os
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from aggregates import load_cube
+from batch_forecast import build_series, load_forecasts, monthly_history
+from charts import (
+    TIME_UNITS,
+    chart_spec,
+    correlation_heatmap,
+    correlogram_chart,
+    cost_sales_profit_bars,
+    cost_sales_profit_lines,
+    dataset,
+    decomposition_lines,
+    expenditure_donut,
+    forecast_lines,
+    product_overview,
+    sales_distribution,
+)
+from correlogram import load_correlogram
+from dataset import ensure_dataset
+from decompose import load_decomposition
+from downsample import bucket, choose_frequency, downsample_lines
+from forecast import ARIMA_ORDER, MODELS, STORE_PATH, fingerprint, forecast
+from kpis import year_kpis
+from order_search import best_order
+from profiling import span
+from query import (
+    SPARKLINE_WINDOWS,
+    category_revenue,
+    monthly_totals,
+    recent_category_revenue,
+    sparklines,
+    top_expenditures,
+)
+from simulation import intervals, simulate_forecasts
+from transactions import channel_sales, select_transactions
+from utils import cached
+
+VARIABLES = ("Sales", "Cost", "Profit")
+TITLES = {
+    "SES": "Simple Exponential Smoothing",
+    "Holt": "Holt's Linear Trend",
+    "ARIMA": "ARIMA",
+}
+
+
+def selected_years(year):
+    """The ``years`` argument of the loaders for a year selection."""
+    return None if year == "All" else [year]
+
+
+def profit_data(year):
+    """Frames of the profit/cost page and the time bucket of its bars.
+
+    When bucketing merged nothing and downsampling dropped nothing, the
+    bars and lines are one frame, so the page serializes it once.
+    """
+
+    def build():
+        totals = monthly_totals(selected_years(year))
+        melted = totals.melt(id_vars="Month", var_name="Category", value_name="Value")
+        frequency = choose_frequency(totals["Month"])
+        bars = bucket(melted, "Month", ["Value"], by=["Category"], freq=frequency)
+        lines = downsample_lines(melted, "Month", "Value", by=["Category"])
+        if bars[list(lines.columns)].equals(lines):
+            lines = bars
+        frames = {
+            "totals": totals,
+            "bars": bars,
+            "lines": lines,
+            "expenditure": top_expenditures(5, selected_years(year)),
+        }
+        return frames, frequency
+
+    with span("transform", "profit data"):
+        return cached("view", build, ensure_dataset(), "profit", year)
+
+
+def profit_charts(year, theme):
+    frames, frequency = profit_data(year)
+    return {
+        "cost_sales_profit": cost_sales_profit_bars(
+            frames["bars"], theme, TIME_UNITS[frequency]
+        ),
+        "cost_sales_profit_lines": cost_sales_profit_lines(frames["lines"], theme),
+        "expenditure_distribution": expenditure_donut(frames["expenditure"], theme),
+    }
+
+
+def profit_tables(year):
+    frames, _ = profit_data(year)
+    return {
+        "monthly_totals": frames["totals"],
+        "metrics": pd.DataFrame([year_kpis(year)]),
+        "top_expenditures": frames["expenditure"],
+        "expenditure_forecasts": stored_forecasts("Expenditure"),
+    }
+
+
+def profit_specs(year, theme):
+    """Vega-Lite specs of the profit page, drawing from named datasets.
+
+    Bars are summed into buckets sized to the visible range; lines keep
+    their LTTB points, so the browser only receives what it can draw. When
+    neither changed the monthly rows, both charts share the bars dataset.
+    """
+    frames, frequency = profit_data(year)
+    bars = dataset("profit", "bars", year, lambda: frames["bars"])
+    if frames["lines"] is frames["bars"]:
+        lines = bars
+    else:
+        lines = dataset("profit", "lines", year, lambda: frames["lines"])
+    expenditure = dataset("profit", "expenditure", year, lambda: frames["expenditure"])
+    return {
+        "bars": chart_spec(
+            ("profit", "bars", frequency, theme),
+            lambda: cost_sales_profit_bars(
+                alt.NamedData(bars[0]), theme, TIME_UNITS[frequency]
+            ),
+            [bars],
+        ),
+        "lines": chart_spec(
+            ("profit", "lines", lines[0], theme),
+            lambda: cost_sales_profit_lines(alt.NamedData(lines[0]), theme),
+            [lines],
+        ),
+        "donut": chart_spec(
+            ("profit", "donut", theme),
+            lambda: expenditure_donut(alt.NamedData(expenditure[0]), theme),
+            [expenditure],
+        ),
+    }
+
+
+def scope_series(scope):
+    """The current series of ``scope`` keyed by name, e.g. every category."""
+    return cached(
+        "view",
+        lambda: {
+            name: series
+            for (series_scope, name, _), series in build_series(load_cube()).items()
+            if series_scope == scope
+        },
+        ensure_dataset(),
+        "series",
+        scope,
+    )
+
+
+def _store_version():
+    try:
+        return os.stat(STORE_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def stored_forecasts(scope):
+    """Batch-store forecasts of every ``scope`` series, one row per step.
+
+    Rows of series that changed since ``batch_forecast.py`` last ran are
+    left out, so the table is empty until the store is rebuilt. The table is
+    built once per dataset and store version.
+    """
+
+    def build():
+        frame = load_forecasts(scope)
+        if frame is None:
+            return pd.DataFrame(columns=["name", "model", "step", "Month", "Forecast"])
+        current = {fingerprint(series) for series in scope_series(scope).values()}
+        frame = frame[frame["fingerprint"].isin(current)]
+        columns = ["name", "model", "step", "Month", "Forecast"]
+        return frame[columns].reset_index(drop=True)
+
+    return cached("view", build, ensure_dataset(), "stored", scope, _store_version())
+
+
+def stored_series_forecasts(scope, name, horizon):
+    """History and stored forecasts of the ``scope`` series ``name``.
+
+    Returns the history as a one-column frame named after the variable and
+    the forecasts of up to ``horizon`` months per model, like
+    ``predict_forecasts``, for ``forecast_chart_data``.
+    """
+    series = scope_series(scope)[name]
+    frame = stored_forecasts(scope)
+    frame = frame[(frame["name"] == name) & (frame["step"] <= horizon)]
+    forecasts = {
+        model: group.set_index("Month")[["Forecast"]].rename(
+            columns={"Forecast": series.name}
+        )
+        for model, group in frame.groupby("model")
+    }
+    forecasts = {model: forecasts[model] for model in MODELS if model in forecasts}
+    return series.to_frame(), forecasts
+
+
+def year_transactions(year, columns=None):
+    """The transactions of every workbook, or of ``year`` only."""
+    return select_transactions(None if year == "All" else year, columns)
+
+
+def product_data(year):
+    """Frames of the product page and the time bucket of its overview."""
+
+    def build():
+        revenue = category_revenue(selected_years(year))
+        frequency = choose_frequency(revenue["Years"])
+        frames = {
+            "revenue": revenue,
+            "overview": bucket(
+                revenue,
+                "Years",
+                ["Sales", "Count"],
+                by=["Product Category"],
+                freq=frequency,
+            ),
+            "totals": revenue.groupby("Product Category", observed=True)["Sales"]
+            .sum()
+            .reset_index(),
+        }
+        return frames, frequency
+
+    with span("transform", "product data"):
+        return cached("view", build, ensure_dataset(), "product", year)
+
+
+def sparkline_data(window, year):
+    """The sparkline frame of the last ``window`` months and its maximum."""
+    return cached(
+        "view",
+        lambda: sparklines(window, selected_years(year)),
+        ensure_dataset(),
+        "sparklines",
+        window,
+        year,
+    )
+
+
+def product_charts(year, theme):
+    frames, frequency = product_data(year)
+    return {
+        "product_overview": product_overview(
+            frames["overview"], theme, TIME_UNITS[frequency]
+        ),
+        "sales_distribution": sales_distribution(frames["totals"], theme),
+    }
+
+
+def product_specs(year, theme):
+    """Vega-Lite specs of the product page, drawing from named datasets.
+
+    Both panels of the overview share one serialized dataset, summed into
+    buckets sized to the visible range.
+    """
+    frames, frequency = product_data(year)
+    overview = dataset("product", "revenue", year, lambda: frames["overview"])
+    totals = dataset("product", "category_totals", year, lambda: frames["totals"])
+    return {
+        "overview": chart_spec(
+            ("product", "overview", frequency, theme),
+            lambda: product_overview(
+                alt.NamedData(overview[0]), theme, TIME_UNITS[frequency]
+            ),
+            [overview],
+        ),
+        "distribution": chart_spec(
+            ("product", "distribution", theme),
+            lambda: sales_distribution(alt.NamedData(totals[0]), theme),
+            [totals],
+        ),
+    }
+
+
+def product_tables(year):
+    frames, _ = product_data(year)
+    tables = {
+        "category_revenue": frames["revenue"],
+        "category_totals": frames["totals"],
+        # Only the report shows the channels, so the page never parses the
+        # month sheets for them.
+        "sales_by_channel": channel_sales(
+            year_transactions(year, ["date", "kind", "channel", "amount"])
+        ),
+        "category_forecasts": stored_forecasts("Product Category"),
+    }
+    for window in SPARKLINE_WINDOWS:
+        recent = recent_category_revenue(window, selected_years(year))
+        tables[f"sales_last_{window}_months"] = recent.fillna(0).reset_index()
+    return tables
+
+
+def history():
+    """Monthly Cost, Sales and Profit indexed by month, the forecast input."""
+    return cached("history", monthly_history, ensure_dataset())
+
+
+def forecast_chart_data(history, forecasts, var):
+    """History followed by each model's forecast, one ``Type`` per line."""
+    parts = []
+    for method, forecast_df in forecasts.items():
+        part = pd.concat([history[[var]], forecast_df]).reset_index()
+        part.columns = ["Date", var]
+        part["Type"] = ["Historical"] * len(history) + [f"{method} Forecast"] * len(
+            forecast_df
+        )
+        parts.append(part)
+    return pd.concat(parts)
+
+
+def simulation_data(forecasts, simulated, var, level=95):
+    """Scenario lines and ``level``% prediction bands of each model.
+
+    ``simulated`` is the result of ``simulate_forecasts``. Returns the
+    scenario medians in the ``forecast_chart_data`` layout (empty without a
+    scenario) and the bands as ``Date``, ``Type``, ``Lower``, ``Upper``.
+    """
+    lines, bands = [], []
+    for model, (baseline, scenario) in simulated.items():
+        index = forecasts[model].index
+        for kind, paths in (("Forecast", baseline), ("Scenario", scenario)):
+            if paths is None:
+                continue
+            lower, upper = intervals(paths, (level,))[level]
+            label = f"{model} {kind}"
+            bands.append(
+                pd.DataFrame(
+                    {"Date": index, "Type": label, "Lower": lower, "Upper": upper}
+                )
+            )
+            if kind == "Scenario":
+                lines.append(
+                    pd.DataFrame(
+                        {"Date": index, var: np.median(paths, axis=0), "Type": label}
+                    )
+                )
+    lines = pd.concat(lines) if lines else pd.DataFrame(columns=["Date", var, "Type"])
+    return lines, pd.concat(bands, ignore_index=True)
+
+
+def forecast_table(forecasts, var):
+    return pd.concat(
+        [
+            forecast_df.rename(columns={var: f"{var} ({model}) Forecast"})
+            for model, forecast_df in forecasts.items()
+        ],
+        axis=1,
+    )
+
+
+def forecast_title(var, models):
+    if len(models) == 1:
+        return f"{var} Forecast using {TITLES[models[0]]}"
+    return f"{var} Forecast using SES, Holt, and ARIMA"
+
+
+def decomposition_data(var, history):
+    """``var`` with its deseasonalized series and trend, indexed by month."""
+    with span("transform", "decomposition"):
+        decomposition = load_decomposition()
+    frame = pd.DataFrame(
+        {
+            var: history[var],
+            f"{var}_Deseasonalized": decomposition["deseasonalized"]["Total", var],
+            f"{var}_Deseasonalized_Trend": decomposition["trend"]["Total", var],
+        }
+    )
+    frame.index.name = "Month"
+    return frame
+
+
+def correlation_data(scope="Total"):
+    """Correlations of the ``scope`` series as ``x``, ``y``, ``Correlation``."""
+    return load_correlogram()["correlations"][scope]
+
+
+def correlogram_data(var, scope="Total"):
+    """ACF and PACF of ``var`` by lag, with their confidence bands."""
+    return load_correlogram()["correlograms"][scope, var]
+
+
+def correlogram_title(var):
+    return f"Autocorrelation for {var}"
+
+
+def predict_forecasts(var, horizon, models=MODELS, order=ARIMA_ORDER):
+    """Forecasts of ``var`` by every model in ``models``, in that order."""
+    series = history()[var]
+    return {model: forecast(series, model, horizon, order) for model in models}
+
+
+def predict_charts(var, theme, horizon):
+    series = history()
+    order = best_order(series[var], block=True)
+    forecasts = predict_forecasts(var, horizon, order=order)
+    _, bands = simulation_data(
+        forecasts, simulate_forecasts(series, var, MODELS, horizon, order), var
+    )
+    decomposition = decomposition_data(var, series).reset_index()
+    return {
+        f"{var.lower()}_forecast": forecast_lines(
+            forecast_chart_data(series, forecasts, var),
+            var,
+            forecast_title(var, MODELS),
+            theme,
+            bands,
+        ),
+        f"{var.lower()}_decomposition": decomposition_lines(
+            decomposition.melt(
+                id_vars="Month", var_name="Component", value_name="Value"
+            ),
+            theme,
+        ),
+        f"{var.lower()}_correlogram": correlogram_chart(
+            correlogram_data(var), correlogram_title(var), theme
+        ),
+        "correlation_matrix": correlation_heatmap(correlation_data()),
+    }
+
+
+def predict_tables(var, horizon):
+    series = history()
+    order = best_order(series[var], block=True)
+    return {
+        f"{var.lower()}_forecast": forecast_table(
+            predict_forecasts(var, horizon, order=order), var
+        ).reset_index(names="Month"),
+        f"{var.lower()}_decomposition": decomposition_data(var, series).reset_index(),
+        f"{var.lower()}_correlogram": correlogram_data(var),
+    }
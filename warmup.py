@@ -0,0 +1,94 @@
+"""Background preloading of the modelling libraries.
+
+The pages import statsmodels only where they fit a model. ``start()``
+imports it in a daemon thread when the server runs its first script, so the
+first visit to the predict page does not wait for it either.
+
+Run ``python warmup.py`` to time the imports of every page in a fresh
+interpreter. It fails when a page loads one of ``HEAVY_MODULES`` at import
+time or takes longer than ``IMPORT_BUDGET`` seconds to import.
+"""
+
+import ast
+import glob
+import importlib
+import json
+import subprocess
+import sys
+import threading
+
+HEAVY_MODULES = (
+    "statsmodels.tsa.arima.model",
+    "statsmodels.tsa.holtwinters",
+)
+IMPORT_BUDGET = 2.0
+PAGES = ["Dashboard.py"] + sorted(glob.glob("pages/*.py"))
+
+_thread = None
+_lock = threading.Lock()
+
+
+def _preload():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def start():
+    """Start preloading ``HEAVY_MODULES`` once per process."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_preload, name="warmup", daemon=True)
+            _thread.start()
+    return _thread
+
+
+def page_imports(path):
+    """The top-level import statements of the page script at ``path``."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(
+        ast.unparse(node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+exec({imports!r})
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def import_time(path, repeat=3):
+    """Best import time of the page at ``path`` and the heavy modules it loads."""
+    probe = _PROBE.format(imports=page_imports(path), heavy=HEAVY_MODULES)
+    runs = [
+        json.loads(
+            subprocess.run(
+                [sys.executable, "-c", probe],
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout
+        )
+        for _ in range(repeat)
+    ]
+    return min(run["seconds"] for run in runs), runs[0]["heavy"]
+
+
+if __name__ == "__main__":
+    failed = False
+    for path in PAGES:
+        seconds, heavy = import_time(path)
+        problems = []
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        if seconds > IMPORT_BUDGET:
+            problems.append(f"over the {IMPORT_BUDGET}s budget")
+        failed = failed or bool(problems)
+        print(f"{path}: {seconds:.2f}s {'; '.join(problems) or 'ok'}")
+    sys.exit(1 if failed else 0)